@@ -0,0 +1,206 @@
+from .communitygraph import simplify_graph
+from .corpus import Corpus
+from .graphs import (
+    AVATAR_TRANSFORMS,
+    AvatarCache,
+    decode_image,
+    node_kwargs,
+)
+
+import argparse
+import copy
+import io
+import shutil
+import tempfile
+import time
+import tracemalloc
+from typing import (
+    Callable,
+    List,
+    Tuple,
+)
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from PIL import (
+    Image,
+    ImageDraw,
+)
+
+
+def measure(function: Callable) -> Tuple[float, int]:
+    """
+    Call `function` twice and return the elapsed time (in seconds) and the peak of the memory allocated meanwhile (in bytes).
+
+    The memory is traced only during the second call, since tracing slows down the function considerably.
+    """
+    t0 = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def create_synthetic_commits(n_commits: int, n_contributors: int, n_repositories: int=100, seed: int=0) -> pd.DataFrame:
+    """
+    Create commits in the text representation (see `cache.query_cached_commit_history`), 1% of which have no author.
+    """
+    rng = np.random.default_rng(seed)
+    authors = np.array([f'user{idx}' for idx in range(n_contributors)], dtype=object)[rng.zipf(1.5, n_commits) % n_contributors]
+    authors[rng.random(n_commits) < 0.01] = np.nan
+    timestamps = pd.Timestamp('2015-01-01', tz='UTC') + pd.to_timedelta(np.sort(rng.integers(0, 10 * 365 * 86400, n_commits)), unit='s')
+    return pd.DataFrame(dict(
+        author = authors,
+        timestamp = timestamps.astype(str),
+        sha = [f'{idx:07x}' for idx in range(n_commits)],
+        tools = '[]',
+        repository = np.array([f'owner/repo{idx}' for idx in range(n_repositories)], dtype=object)[rng.integers(0, n_repositories, n_commits)],
+    ))
+
+
+def benchmark_contributors(n_commits: int=1_000_000, n_contributors: int=5_000):
+    """
+    Compare partitioning the commits by contributor using a mask per contributor (materializing all slices), against `Corpus.iter_contributors` (including the creation of the corpus).
+    """
+    df = create_synthetic_commits(n_commits, n_contributors)
+    tools = pd.DataFrame(dict(repository = [], timestamp = [], sha = [], tool = [], category = []))
+
+    def run_masks():
+        contributors = df['author'].dropna().drop_duplicates().tolist()
+        slices = {contributor: df[df['author'] == contributor] for contributor in contributors}
+        return sum(len(contributor_df) for contributor_df in slices.values())
+
+    def run_corpus():
+        corpus = Corpus(df, tools)
+        return sum(len(contributor_df) for _, contributor_df in corpus.iter_contributors())
+
+    print(f'{n_commits} commits, {df["author"].nunique()} contributors')
+    for label, function in (('Masks', run_masks), ('Corpus.iter_contributors', run_corpus)):
+        elapsed, peak = measure(function)
+        print(f'{label}: {elapsed:.1f} s, peak memory allocated: {peak / 1024 ** 2:.0f} MB')
+
+
+def create_synthetic_avatars(n_images: int, size: int, seed: int=0) -> List[bytes]:
+    """
+    Create JPEG-encoded images, and PNG-encoded images with an alpha channel (every second image), similar to the avatars of GitHub.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:size, :size] / size
+    images = list()
+    for idx in range(n_images):
+        weights = rng.random((3, 3))
+        img = np.stack([weights[c, 0] * x + weights[c, 1] * y + weights[c, 2] * np.sin(10 * x * y) for c in range(3)], axis=2)
+        img = (255 * img / img.max()).astype(np.uint8)
+        buffer = io.BytesIO()
+        if idx % 2 == 1:
+            img = np.concatenate([img, (255 * (x > 0.1))[:, :, None].astype(np.uint8)], axis=2)
+            Image.fromarray(img).save(buffer, 'PNG')
+        else:
+            Image.fromarray(img).save(buffer, 'JPEG')
+        images.append(buffer.getvalue())
+    return images
+
+
+def create_avatar_reference(content: bytes, transform: str, filename: str):
+    """
+    Create an avatar like previous versions did: the transform is applied at the full resolution (float64), and the result is then resized.
+    """
+    import scipy.ndimage as ndi
+    import skimage, skimage.transform
+
+    img = skimage.img_as_float(np.asarray(Image.open(io.BytesIO(content))))
+    if transform == 'disk':
+        mask = np.ones(img.shape[:2], bool)
+        mask[mask.shape[0] // 2, mask.shape[1] // 2] = False
+        mask = ndi.distance_transform_edt(mask) < min(mask.shape) // 2 - 2
+        avatar = np.concatenate([img[:, :, :3], mask[:, :, None]], axis=2)
+    else:
+        size = max(img.shape[:2])
+        mask = Image.new('RGB', (size, size), 'black')
+        ImageDraw.Draw(mask).rounded_rectangle((0, 0, size, size), fill='white', width=0, radius=round(size * 0.2))
+        mask = np.asarray(mask)[:, :, 0].copy()
+        if img.shape[2] == 4:
+            img = (1 + (img[:, :, :3] - 1) * img[:, :, 3][:, :, None])
+        avatar = np.concatenate([img, mask[:, :, None]], axis=2).clip(0, 1)
+    avatar = skimage.transform.resize(avatar, (128, 128), anti_aliasing=True)
+    Image.fromarray(skimage.img_as_ubyte(avatar)).save(filename)
+
+
+def benchmark_avatars(n_images: int=100, size: int=460):
+    """
+    Compare the cost per avatar (decoding, transforms, and writing) of the previous pipeline against `graphs.AvatarCache` (in a single thread, without downloads).
+    """
+    images = create_synthetic_avatars(n_images, size)
+    cache_dir = tempfile.mkdtemp()
+    avatar_cache = AvatarCache(cache_dir)
+
+    def run_reference():
+        for transform in AVATAR_TRANSFORMS.keys():
+            for idx, content in enumerate(images):
+                create_avatar_reference(content, transform, f'{cache_dir}/{idx}-{transform}.png')
+
+    def run_batches():
+        for batch_start in range(0, len(images), avatar_cache.batch_size):
+            batch = [(idx, decode_image(content)) for idx, content in enumerate(images[batch_start : batch_start + avatar_cache.batch_size], start=batch_start)]
+            avatar_cache.create([(f'{idx}-{transform}', img, transform) for idx, img in batch for transform in AVATAR_TRANSFORMS.keys()])
+
+    print(f'{n_images} images of {size}×{size} pixels, {len(AVATAR_TRANSFORMS)} transforms')
+    for label, function in (('Full resolution (float64)', run_reference), ('Downsized batches (uint8)', run_batches)):
+        elapsed, peak = measure(function)
+        print(f'{label}: {1000 * elapsed / (n_images * len(AVATAR_TRANSFORMS)):.1f} ms per avatar, peak memory allocated: {peak / 1024 ** 2:.0f} MB')
+    shutil.rmtree(cache_dir)
+
+
+def create_synthetic_graph(n_nodes: int, n_repositories: int=None, seed: int=0) -> Tuple[nx.Graph, List[str], List[str]]:
+    """
+    Create a bipartite graph of contributors and repositories (like `communitygraph.render_community_graph`), where the popularity of the repositories follows a power law.
+    """
+    rng = np.random.default_rng(seed)
+    n_repositories = n_nodes // 10 if n_repositories is None else n_repositories
+    repositories = [f'owner{idx % 20}/repo{idx}' for idx in range(n_repositories)]
+    authors = [f'user{idx}' for idx in range(n_nodes - n_repositories)]
+    G = nx.Graph()
+    for repo in repositories:
+        G.add_node(repo, image='', type='repository', label=repo, **node_kwargs)
+    for author in authors:
+        G.add_node(author, image='', type='author', label=author, **node_kwargs)
+        for repo_idx in frozenset(rng.zipf(1.3, rng.integers(1, 4)) % n_repositories):
+            G.add_edge(author, repositories[repo_idx], headclip='false', tailclip='false')
+    return G, authors, repositories
+
+
+def benchmark_simplify_graph(n_nodes: int=10_000):
+    """
+    Measure the simplification of a synthetic community graph by `communitygraph.simplify_graph` (the results are compared against the previous simplification by the tests).
+    """
+    G, authors, repositories = create_synthetic_graph(n_nodes)
+    avatar_cache = AvatarCache(tempfile.mkdtemp())
+
+    def run():
+        H = copy.deepcopy(G)
+        simplify_graph(H, authors, repositories, avatar_cache)
+        return H
+
+    print(f'{len(G.nodes)} nodes, {len(G.edges)} edges')
+    elapsed, peak = measure(run)
+    print(f'Priority queue: {elapsed:.2f} s, peak memory allocated: {peak / 1024 ** 2:.0f} MB')
+    shutil.rmtree(avatar_cache.cache_dir)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', choices=['contributors', 'avatars', 'simplify_graph'])
+    parser.add_argument('--size', type=int, help='Number of commits (or items) to benchmark with', default=None)
+    args = parser.parse_args()
+
+    if args.benchmark == 'contributors':
+        benchmark_contributors(**(dict(n_commits = args.size) if args.size is not None else dict()))
+    elif args.benchmark == 'avatars':
+        benchmark_avatars(**(dict(n_images = args.size) if args.size is not None else dict()))
+    elif args.benchmark == 'simplify_graph':
+        benchmark_simplify_graph(**(dict(n_nodes = args.size) if args.size is not None else dict()))
@@ -1,46 +1,605 @@
+import os
 import pathlib
 import csv
 import glob
+import hashlib
+import json
 import re
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
 
+import numpy as np
 import pandas as pd
+from tqdm import tqdm
 from github.Repository import Repository
 from typing import (
+    Any,
+    Dict,
     List,
+    Optional,
+    Tuple,
     Union,
 )
 
 
+def get_repository_name(repository: Union[str, Repository]) -> str:
+    return repository if isinstance(repository, str) else f'{repository.owner.login}/{repository.name}'
+
+
 def get_cached_repository_filepath(repository: Union[str, Repository]) -> str:
-    repo = repository if isinstance(repository, str) else f'{repository.owner.login}/{repository.name}'
+    repo = get_repository_name(repository)
     return f'cache/repositories/{repo}.csv'
 
 
+def get_checkpoint_directory(repository: Union[str, Repository]) -> str:
+    repo = get_repository_name(repository)
+    return f'cache/checkpoints/{repo}'
+
+
+def get_cached_tool_index_filepath(repository: Union[str, Repository]) -> str:
+    repo = get_repository_name(repository)
+    return f'cache/tools/{repo}.csv'
+
+
+def get_cached_category_index_filepath() -> str:
+    return f'cache/categories.csv'
+
+
 def get_cached_avatars_filepath() -> str:
     return f'cache/avatars.csv'
 
 
-def get_cached_commit_history(repository: Repository) -> pd.DataFrame:
-    cache_filename = get_cached_repository_filepath(repository)
-    if pathlib.Path(cache_filename).is_file():
-        return pd.read_csv(cache_filename)
+def get_cached_shed_files_filepath() -> str:
+    return f'cache/shed_files.csv'
+
+
+def get_cached_manifest_filepath() -> str:
+    return f'cache/manifest.csv'
+
+
+def get_cached_list_filepath(url: str) -> str:
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return f'cache/lists/{key}.json'
+
+
+def to_typed_commit_history(history: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a commit history from its text representation (as in the CSV files) to typed columns.
+
+    Timestamps are parsed (UTC), authors and SHAs become categorical, and the tools are parsed from JSON (`None` for commits without an author).
+    """
+    return pd.DataFrame(dict(
+        author = history['author'].astype('category'),
+        timestamp = pd.to_datetime(history['timestamp'], utc=True).astype('datetime64[ns, UTC]'),
+        sha = history['sha'].astype('category'),
+        tools = [json.loads(tools) if isinstance(tools, str) and len(tools) > 0 else None for tools in history['tools'].tolist()],
+    ))
+
+
+def to_text_commit_history(history: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a commit history from typed columns to its text representation (inverse of `to_typed_commit_history`).
+    """
+    return pd.DataFrame(dict(
+        author = history['author'].astype(object).values,
+        timestamp = history['timestamp'].astype(str).values,
+        sha = history['sha'].astype(object).values,
+        tools = [to_text_tools(tools) for tools in history['tools'].tolist()],
+    ))
+
+
+def to_text_tools(tools: Any) -> Any:
+    """
+    Convert the parsed tools of a commit back to JSON (as in the CSV files). Tools which are already in text representation are passed through.
+    """
+    if tools is None:
+        return np.nan
+    elif isinstance(tools, (str, float)):
+        return tools
+    else:
+        return json.dumps([dict(name = tool['name'], categories = list(tool['categories'])) for tool in tools])
+
+
+def to_tool_index(history: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the tools of a commit history to a long table, with one row per commit, tool, and category.
+
+    Categories are lower-cased and stripped. Tools without categories get a single row with an empty category.
+    """
+    rows = list()
+    for sha, timestamp, tools in zip(history['sha'].tolist(), history['timestamp'].tolist(), history['tools'].tolist()):
+        if not isinstance(tools, str) or len(tools) == 0: continue
+        for tool in json.loads(tools):
+            categories = [category.lower().strip() for category in tool['categories']]
+            for category in dict.fromkeys(categories) if len(categories) > 0 else ['']:
+                rows.append((str(sha), str(timestamp), tool['name'], category))
+    return pd.DataFrame(rows, columns=['sha', 'timestamp', 'tool', 'category']).drop_duplicates(ignore_index=True)
+
+
+def to_category_index(tool_index: pd.DataFrame) -> pd.DataFrame:
+    """
+    Get the inverted index of a tool index, with one row per category and tool.
+    """
+    category_index = tool_index[['category', 'tool']].drop_duplicates()
+    return category_index.sort_values(['category', 'tool'], ignore_index=True)
+
+
+def to_utc_string(timestamp: Union[str, datetime]) -> str:
+    """
+    Convert a timestamp to its text representation (as in the CSV files), which sorts lexicographically.
+    """
+    timestamp = pd.Timestamp(timestamp)
+    return str(timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC'))
+
+
+class Storage:
+    """
+    Base class of the storage backends for the commit histories.
+    """
+
+    # Whether the typed columns are read directly (otherwise, `read_typed` and `query_typed` parse the text representation)
+    typed = False
+
+    def read_typed(self, repository: Union[str, Repository]) -> pd.DataFrame:
+        return to_typed_commit_history(self.read(repository))
+
+    def query(self, repositories: Optional[List[str]]=None, authors: Optional[List[str]]=None, since: Optional[Union[str, datetime]]=None, until: Optional[Union[str, datetime]]=None) -> pd.DataFrame:
+        """
+        Get the commits of the given repositories (all by default) in text representation, with an additional `repository` column.
+
+        The commits can be filtered by author and by time (`since` is inclusive, `until` is exclusive). The rows are in the order of the repositories.
+        """
+        if repositories is None: repositories = self.get_repositories()
+        df_list = list()
+        for repo in repositories:
+            df = self.read(repo)
+            if authors is not None:
+                df = df[df['author'].isin(authors)]
+            if since is not None:
+                df = df[df['timestamp'].astype(str) >= to_utc_string(since)]
+            if until is not None:
+                df = df[df['timestamp'].astype(str) < to_utc_string(until)]
+            df = df.assign(repository = repo)
+            df_list.append(df)
+        if len(df_list) > 0:
+            return pd.concat(df_list, ignore_index=True)
+        else:
+            return pd.DataFrame(columns=['author', 'timestamp', 'sha', 'tools', 'repository'])
+
+    def query_typed(self, repositories: Optional[List[str]]=None, authors: Optional[List[str]]=None, since: Optional[Union[str, datetime]]=None, until: Optional[Union[str, datetime]]=None) -> pd.DataFrame:
+        """
+        Get the commits of the given repositories (all by default) in typed representation (see `to_typed_commit_history`), with an additional `repository` column.
+
+        The commits are filtered as by `query`.
+        """
+        if repositories is None: repositories = self.get_repositories()
+        df_list = list()
+        for repo in repositories:
+            df = self.read_typed(repo)
+            if authors is not None:
+                df = df[df['author'].isin(authors)]
+            if since is not None:
+                df = df[df['timestamp'] >= pd.Timestamp(to_utc_string(since))]
+            if until is not None:
+                df = df[df['timestamp'] < pd.Timestamp(to_utc_string(until))]
+            df = df.assign(repository = repo)
+            df_list.append(df)
+        if len(df_list) > 0:
+            return pd.concat(df_list, ignore_index=True)
+        else:
+            return to_typed_commit_history(pd.DataFrame(columns=['author', 'timestamp', 'sha', 'tools'])).assign(repository = pd.Series(dtype=object))
+
+
+class CsvStorage(Storage):
+    """
+    Stores the commit history of each repository as a CSV file (the text representation, readable in git diffs).
+    """
+
+    def get_filepath(self, repository: Union[str, Repository]) -> str:
+        repo = get_repository_name(repository)
+        return f'cache/repositories/{repo}.csv'
+
+    def get_repositories(self) -> List[str]:
+        repositories = list()
+        for cache_filepath in glob.glob('cache/repositories/*/*.csv'):
+            match = re.match(r'^cache/repositories/(.*).csv$', cache_filepath)
+            repositories.append(match.group(1))
+        return list(sorted(repositories))
+
+    def read(self, repository: Union[str, Repository]) -> pd.DataFrame:
+        cache_filename = self.get_filepath(repository)
+        if pathlib.Path(cache_filename).is_file():
+            return pd.read_csv(cache_filename, dtype=dict(sha=str))
+        else:
+            return pd.DataFrame(columns=['author', 'timestamp', 'sha', 'tools'])
+
+    def write(self, repository: Union[str, Repository], history: pd.DataFrame):
+        cache_filename = self.get_filepath(repository)
+        cache_directory = pathlib.Path(cache_filename).parents[0]
+        cache_directory.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file first, so that an interrupted write never leaves a truncated cache behind
+        tmp_filename = f'{cache_filename}.tmp'
+        history.to_csv(tmp_filename, index=False, quoting=csv.QUOTE_NONNUMERIC)
+        os.replace(tmp_filename, cache_filename)
+
+
+class ParquetStorage(Storage):
+    """
+    Stores the commit history of each repository as a typed columnar (Parquet) file, and exports it as CSV too.
+
+    Timestamps are stored as int64 (UTC), authors and SHAs are dictionary-encoded, and the tools are stored pre-parsed.
+    Requires `pyarrow`.
+    """
+
+    typed = True
+
+    def __init__(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.pq = pq
+        self.schema = pa.schema([
+            ('author', pa.dictionary(pa.int32(), pa.string())),
+            ('timestamp', pa.timestamp('ns', tz='UTC')),
+            ('sha', pa.dictionary(pa.int32(), pa.string())),
+            ('tools', pa.list_(pa.struct([('name', pa.string()), ('categories', pa.list_(pa.string()))]))),
+        ])
+        self.csv_storage = CsvStorage()
+
+    def get_filepath(self, repository: Union[str, Repository]) -> str:
+        repo = get_repository_name(repository)
+        return f'cache/columnar/{repo}.parquet'
+
+    def get_repositories(self) -> List[str]:
+        repositories = list()
+        for cache_filepath in glob.glob('cache/columnar/*/*.parquet'):
+            match = re.match(r'^cache/columnar/(.*).parquet$', cache_filepath)
+            repositories.append(match.group(1))
+
+        # Also include the repositories which are only available as CSV files
+        return list(sorted(frozenset(repositories) | frozenset(self.csv_storage.get_repositories())))
+
+    def read(self, repository: Union[str, Repository]) -> pd.DataFrame:
+        return to_text_commit_history(self.read_typed(repository))
+
+    def is_outdated(self, repository: Union[str, Repository]) -> bool:
+        """
+        Tell whether the CSV file is newer than the Parquet file contents (e.g., after the CSV files were updated via git).
+
+        The modification time of the CSV file is recorded in the metadata of the Parquet file when it is written (see `write`).
+        """
+        csv_filepath = pathlib.Path(self.csv_storage.get_filepath(repository))
+        parquet_filepath = pathlib.Path(self.get_filepath(repository))
+        if not csv_filepath.is_file(): return False
+        if not parquet_filepath.is_file(): return True
+        metadata = self.pq.read_schema(parquet_filepath).metadata or dict()
+        return csv_filepath.stat().st_mtime > float(metadata.get(b'csv_mtime', -1))
+
+    def read_typed(self, repository: Union[str, Repository]) -> pd.DataFrame:
+        cache_filename = self.get_filepath(repository)
+        if self.is_outdated(repository):
+            return self.csv_storage.read_typed(repository)
+        elif pathlib.Path(cache_filename).is_file():
+            return self.pq.read_table(cache_filename).to_pandas()
+        else:
+            return to_typed_commit_history(pd.DataFrame(columns=['author', 'timestamp', 'sha', 'tools']))
+
+    def write(self, repository: Union[str, Repository], history: pd.DataFrame):
+        cache_filename = self.get_filepath(repository)
+        cache_directory = pathlib.Path(cache_filename).parents[0]
+        cache_directory.mkdir(parents=True, exist_ok=True)
+
+        # Keep the CSV export up to date (first, so that its modification time can be recorded)
+        self.csv_storage.write(repository, history)
+        csv_mtime = pathlib.Path(self.csv_storage.get_filepath(repository)).stat().st_mtime
+
+        # Write to a temporary file first, so that an interrupted write never leaves a truncated cache behind
+        tmp_filename = f'{cache_filename}.tmp'
+        table = self.pa.Table.from_pandas(to_typed_commit_history(history), schema=self.schema, preserve_index=False)
+        table = table.replace_schema_metadata(dict(table.schema.metadata or dict(), csv_mtime=repr(csv_mtime)))
+        self.pq.write_table(table, tmp_filename)
+        os.replace(tmp_filename, cache_filename)
+
+
+class SqliteStorage(Storage):
+    """
+    Stores the commit histories of all repositories in a single SQLite database, and exports them as CSV too.
+
+    The `commits` table holds one row per commit (along with the tools as JSON, as in the CSV files), the `commit_tools` table holds the tools updated by each commit, and the `tool_categories` table holds the categories of each of these tools.
+    The tables are indexed by repository, author, timestamp, tool name, and category, so that queries only read the matching commits.
+    """
+
+    # Writes are serialized, because the IDs of new rows are assigned by the writer
+    lock = threading.Lock()
+
+    def __init__(self, filepath: str='cache/commits.sqlite'):
+        self.filepath = filepath
+        self.csv_storage = CsvStorage()
+        pathlib.Path(filepath).parents[0].mkdir(parents=True, exist_ok=True)
+        with closing(self.connect()) as conn, conn:
+            conn.executescript("""
+                PRAGMA journal_mode = WAL;
+                CREATE TABLE IF NOT EXISTS repositories (
+                    repository TEXT PRIMARY KEY,
+                    csv_mtime REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS commits (
+                    id INTEGER PRIMARY KEY,
+                    repository TEXT NOT NULL,
+                    author TEXT,
+                    timestamp TEXT NOT NULL,
+                    sha TEXT NOT NULL,
+                    tools TEXT
+                );
+                CREATE TABLE IF NOT EXISTS commit_tools (
+                    commit_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    tool TEXT NOT NULL,
+                    PRIMARY KEY (commit_id, position)
+                );
+                CREATE TABLE IF NOT EXISTS tool_categories (
+                    commit_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    category TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS commits_repository ON commits (repository);
+                CREATE INDEX IF NOT EXISTS commits_author ON commits (author);
+                CREATE INDEX IF NOT EXISTS commits_timestamp ON commits (timestamp);
+                CREATE INDEX IF NOT EXISTS commit_tools_tool ON commit_tools (tool);
+                CREATE INDEX IF NOT EXISTS tool_categories_commit ON tool_categories (commit_id, position);
+                CREATE INDEX IF NOT EXISTS tool_categories_category ON tool_categories (category);
+            """)
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.filepath, timeout=60)
+
+    def get_repositories(self) -> List[str]:
+        with closing(self.connect()) as conn:
+            repositories = [row[0] for row in conn.execute('SELECT repository FROM repositories')]
+
+        # Also include the repositories which are only available as CSV files
+        return list(sorted(frozenset(repositories) | frozenset(self.csv_storage.get_repositories())))
+
+    def get_csv_mtimes(self) -> Dict[str, float]:
+        with closing(self.connect()) as conn:
+            return dict(conn.execute('SELECT repository, csv_mtime FROM repositories').fetchall())
+
+    def is_outdated(self, repository: Union[str, Repository], csv_mtimes: Optional[Dict[str, float]]=None) -> bool:
+        """
+        Tell whether the CSV file is newer than the database contents (e.g., after the CSV files were updated via git).
+        """
+        if csv_mtimes is None: csv_mtimes = self.get_csv_mtimes()
+        csv_filepath = pathlib.Path(self.csv_storage.get_filepath(repository))
+        if not csv_filepath.is_file(): return False
+        return csv_filepath.stat().st_mtime > csv_mtimes.get(get_repository_name(repository), -1)
+
+    def select(self, conn: sqlite3.Connection, where: str, params: Tuple) -> pd.DataFrame:
+        """
+        Read the commits which match the `where` clause (in text representation, with an additional `repository` column).
+        """
+        commits = conn.execute(f'SELECT author, timestamp, sha, tools, repository FROM commits WHERE {where} ORDER BY id', params).fetchall()
+        columns = list(zip(*commits)) if len(commits) > 0 else [tuple()] * 5
+        return pd.DataFrame(dict(
+            author = pd.Series(columns[0], dtype=object).fillna(np.nan),
+            timestamp = pd.Series(columns[1], dtype=object),
+            sha = pd.Series(columns[2], dtype=object),
+            tools = pd.Series(columns[3], dtype=object).fillna(np.nan),
+            repository = pd.Series(columns[4], dtype=object),
+        ))
+
+    def read(self, repository: Union[str, Repository]) -> pd.DataFrame:
+        if self.is_outdated(repository):
+            return self.csv_storage.read(repository)
+        with closing(self.connect()) as conn:
+            return self.select(conn, 'repository = ?', (get_repository_name(repository),)).drop(columns=['repository'])
+
+    def query(self, repositories: Optional[List[str]]=None, authors: Optional[List[str]]=None, since: Optional[Union[str, datetime]]=None, until: Optional[Union[str, datetime]]=None) -> pd.DataFrame:
+        if repositories is None: repositories = self.get_repositories()
+
+        # Repositories with outdated database contents are read from the CSV files instead
+        csv_mtimes = self.get_csv_mtimes()
+        outdated = [repo for repo in repositories if self.is_outdated(repo, csv_mtimes)]
+        outdated_set = frozenset(outdated)
+        fresh = [repo for repo in repositories if repo not in outdated_set]
+
+        # Push the filters down to SQL
+        conditions = [f'repository IN ({", ".join("?" * len(fresh))})']
+        params = list(fresh)
+        if authors is not None:
+            conditions.append(f'author IN ({", ".join("?" * len(authors))})')
+            params += list(authors)
+        if since is not None:
+            conditions.append('timestamp >= ?')
+            params.append(to_utc_string(since))
+        if until is not None:
+            conditions.append('timestamp < ?')
+            params.append(to_utc_string(until))
+        with closing(self.connect()) as conn:
+            df = self.select(conn, ' AND '.join(conditions), tuple(params))
+        if len(outdated) > 0:
+            df = pd.concat([df, super().query(outdated, authors, since, until)], ignore_index=True)
+
+        # Restore the order of the repositories (the sort is stable, so the order of the commits is preserved)
+        order = {repo: ridx for ridx, repo in enumerate(repositories)}
+        return df.sort_values('repository', key=lambda column: column.map(order), kind='stable', ignore_index=True)
+
+    def write(self, repository: Union[str, Repository], history: pd.DataFrame):
+        repo = get_repository_name(repository)
+
+        # Keep the CSV export up to date (first, so that its modification time can be recorded)
+        self.csv_storage.write(repository, history)
+        csv_mtime = pathlib.Path(self.csv_storage.get_filepath(repository)).stat().st_mtime
+
+        with self.lock, closing(self.connect()) as conn, conn:
+
+            # Remove the previous commit history of the repository
+            commit_ids = 'SELECT id FROM commits WHERE repository = ?'
+            conn.execute(f'DELETE FROM tool_categories WHERE commit_id IN ({commit_ids})', (repo,))
+            conn.execute(f'DELETE FROM commit_tools WHERE commit_id IN ({commit_ids})', (repo,))
+            conn.execute('DELETE FROM commits WHERE repository = ?', (repo,))
+
+            # Insert the commits, their tools, and the categories of the tools
+            first_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM commits').fetchone()[0]
+            commit_rows, tool_rows, category_rows = list(), list(), list()
+            for commit_id, (author, timestamp, sha, tools) in enumerate(zip(history['author'], history['timestamp'], history['sha'], history['tools']), start=first_id):
+                scanned = isinstance(tools, str) and len(tools) > 0
+                commit_rows.append((commit_id, repo, author if isinstance(author, str) and len(author) > 0 else None, str(timestamp), str(sha), tools if scanned else None))
+                for position, tool in enumerate(json.loads(tools) if scanned else list()):
+                    tool_rows.append((commit_id, position, tool['name']))
+                    category_rows.extend((commit_id, position, category) for category in tool['categories'])
+            conn.executemany('INSERT INTO commits VALUES (?, ?, ?, ?, ?, ?)', commit_rows)
+            conn.executemany('INSERT INTO commit_tools VALUES (?, ?, ?)', tool_rows)
+            conn.executemany('INSERT INTO tool_categories VALUES (?, ?, ?)', category_rows)
+            conn.execute('INSERT OR REPLACE INTO repositories VALUES (?, ?)', (repo, csv_mtime))
+
+
+STORAGES = dict(
+    csv = CsvStorage,
+    parquet = ParquetStorage,
+    sqlite = SqliteStorage,
+)
+
+# The storage backend used for the commit histories
+storage: Storage = CsvStorage()
+
+
+def set_storage(name: str):
+    global storage
+    storage = STORAGES[name]()
+
+
+def migrate_commit_histories(target: str):
+    """
+    Convert the cached commit histories to the given storage format (`csv`, `parquet`, or `sqlite`).
+    """
+    source_storage = ParquetStorage() if target == 'csv' else CsvStorage()
+    target_storage = STORAGES[target]()
+    for repo in tqdm(source_storage.get_repositories(), desc=f'Migrating cache to {target}'):
+        target_storage.write(repo, source_storage.read(repo))
+
+
+def get_cached_commit_history(repository: Union[str, Repository]) -> pd.DataFrame:
+    return storage.read(repository)
+
+
+def get_cached_commit_history_typed(repository: Union[str, Repository]) -> pd.DataFrame:
+    return storage.read_typed(repository)
+
+
+def set_cached_commit_history(repository: Union[str, Repository], history: pd.DataFrame):
+    storage.write(repository, history)
+
+
+def query_cached_commit_history(repositories: Optional[List[str]]=None, authors: Optional[List[str]]=None, since: Optional[Union[str, datetime]]=None, until: Optional[Union[str, datetime]]=None) -> pd.DataFrame:
+    """
+    Get the cached commits of multiple repositories (see `Storage.query`), filtered by the storage backend if it supports that.
+    """
+    return storage.query(repositories, authors, since, until)
+
+
+def query_cached_commit_history_typed(repositories: Optional[List[str]]=None, authors: Optional[List[str]]=None, since: Optional[Union[str, datetime]]=None, until: Optional[Union[str, datetime]]=None) -> pd.DataFrame:
+    """
+    Get the cached commits of multiple repositories in typed representation (see `Storage.query_typed`).
+    """
+    return storage.query_typed(repositories, authors, since, until)
+
+
+def get_checkpoint_segments(repository: Union[str, Repository]) -> pd.DataFrame:
+    segment_filepaths = sorted(glob.glob(f'{get_checkpoint_directory(repository)}/*.csv'))
+    if len(segment_filepaths) > 0:
+        return pd.concat([pd.read_csv(segment_filepath, dtype=dict(sha=str)) for segment_filepath in segment_filepaths])
     else:
         return pd.DataFrame(columns=['author', 'timestamp', 'sha', 'tools'])
 
 
-def set_cached_commit_history(repository: Repository, history: pd.DataFrame):
-    cache_filename = get_cached_repository_filepath(repository)
+def append_checkpoint_segment(repository: Union[str, Repository], segment: pd.DataFrame):
+    checkpoint_directory = pathlib.Path(get_checkpoint_directory(repository))
+    checkpoint_directory.mkdir(parents=True, exist_ok=True)
+    segment_filename = str(checkpoint_directory / f'{len(list(checkpoint_directory.glob("*.csv"))):05d}.csv')
+
+    # Write to a temporary file first, so that an interrupted write never leaves a truncated segment behind
+    tmp_filename = f'{segment_filename}.tmp'
+    segment.to_csv(tmp_filename, index=False, quoting=csv.QUOTE_NONNUMERIC)
+    os.replace(tmp_filename, segment_filename)
+
+
+def clear_checkpoint_segments(repository: Union[str, Repository]):
+    checkpoint_directory = pathlib.Path(get_checkpoint_directory(repository))
+    if checkpoint_directory.is_dir():
+        for segment_filepath in checkpoint_directory.iterdir():
+            segment_filepath.unlink()
+        checkpoint_directory.rmdir()
+
+
+def get_cached_repositories() -> List[str]:
+    return storage.get_repositories()
+
+
+def is_cached_tool_index_outdated(repository: Union[str, Repository]) -> bool:
+    """
+    Tell whether the tool index of a repository is missing or older than its commit history (the CSV file, which all storages export).
+    """
+    tool_index_filepath = pathlib.Path(get_cached_tool_index_filepath(repository))
+    history_filepath = pathlib.Path(get_cached_repository_filepath(repository))
+    if not tool_index_filepath.is_file(): return True
+    return history_filepath.is_file() and history_filepath.stat().st_mtime > tool_index_filepath.stat().st_mtime
+
+
+def get_cached_tool_index(repository: Union[str, Repository]) -> pd.DataFrame:
+    """
+    Get the tool index of a repository (see `to_tool_index`), which is computed from the commit history if it is outdated.
+    """
+    if is_cached_tool_index_outdated(repository):
+        return to_tool_index(get_cached_commit_history(repository))
+    else:
+        return pd.read_csv(get_cached_tool_index_filepath(repository), dtype=str, keep_default_na=False)
+
+
+def set_cached_tool_index(repository: Union[str, Repository], tool_index: pd.DataFrame):
+    cache_filename = get_cached_tool_index_filepath(repository)
     cache_directory = pathlib.Path(cache_filename).parents[0]
     cache_directory.mkdir(parents=True, exist_ok=True)
-    history.to_csv(cache_filename, index=False, quoting=csv.QUOTE_NONNUMERIC)
 
+    # Write to a temporary file first, so that an interrupted write never leaves a truncated cache behind
+    tmp_filename = f'{cache_filename}.tmp'
+    tool_index.to_csv(tmp_filename, index=False, quoting=csv.QUOTE_NONNUMERIC)
+    os.replace(tmp_filename, cache_filename)
 
-def get_cached_repositories() -> List[str]:
-    repositories = list()
-    for cache_filepath in glob.glob('cache/repositories/*/*.csv'):
-        match = re.match(r'^cache/repositories/(.*).csv$', cache_filepath)
-        repositories.append(match.group(1))
-    return repositories
+
+def query_cached_tool_index(repositories: Optional[List[str]]=None) -> pd.DataFrame:
+    """
+    Get the tool indices of multiple repositories (all by default), with an additional `repository` column.
+    """
+    if repositories is None: repositories = get_cached_repositories()
+    df_list = [get_cached_tool_index(repo).assign(repository = repo) for repo in repositories]
+    if len(df_list) > 0:
+        return pd.concat(df_list, ignore_index=True)
+    else:
+        return pd.DataFrame(columns=['sha', 'timestamp', 'tool', 'category', 'repository'])
+
+
+def get_cached_category_index() -> pd.DataFrame:
+    """
+    Get the inverted index of the tool indices of all repositories (see `to_category_index`), which is computed if it is outdated.
+    """
+    cache_filename = get_cached_category_index_filepath()
+    if pathlib.Path(cache_filename).is_file():
+        mtime = pathlib.Path(cache_filename).stat().st_mtime
+        tool_index_filepaths = glob.glob(get_cached_tool_index_filepath('*/*'))
+        repositories = get_cached_repositories()
+        if all(pathlib.Path(filepath).stat().st_mtime <= mtime for filepath in tool_index_filepaths) and not any(is_cached_tool_index_outdated(repo) for repo in repositories):
+            return pd.read_csv(cache_filename, dtype=str, keep_default_na=False)
+    return to_category_index(query_cached_tool_index())
+
+
+def set_cached_category_index(category_index: pd.DataFrame):
+    cache_filename = get_cached_category_index_filepath()
+    cache_directory = pathlib.Path(cache_filename).parents[0]
+    cache_directory.mkdir(parents=True, exist_ok=True)
+    category_index.to_csv(cache_filename, index=False, quoting=csv.QUOTE_NONNUMERIC)
 
 
 def get_cached_avatars() -> pd.DataFrame:
@@ -58,3 +617,57 @@ def set_cached_avatars(avatars: pd.DataFrame):
     cache_directory = pathlib.Path(cache_filename).parents[0]
     cache_directory.mkdir(parents=True, exist_ok=True)
     avatars.to_csv(cache_filename, index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+
+def get_cached_shed_files() -> pd.DataFrame:
+    cache_filename = get_cached_shed_files_filepath()
+    if pathlib.Path(cache_filename).is_file():
+        df = pd.read_csv(cache_filename, dtype=str)
+        df['categories'] = df['categories'].fillna('')
+        return df
+    else:
+        return pd.DataFrame(columns=['sha', 'categories'])
+
+
+def set_cached_shed_files(shed_files: pd.DataFrame):
+    cache_filename = get_cached_shed_files_filepath()
+    cache_directory = pathlib.Path(cache_filename).parents[0]
+    cache_directory.mkdir(parents=True, exist_ok=True)
+    shed_files.to_csv(cache_filename, index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+
+def get_cached_manifest() -> pd.DataFrame:
+    cache_filename = get_cached_manifest_filepath()
+    if pathlib.Path(cache_filename).is_file():
+        return pd.read_csv(cache_filename, dtype=str, keep_default_na=False)
+    else:
+        return pd.DataFrame(columns=['repository', 'pushed_at', 'head_sha'])
+
+
+def set_cached_manifest(manifest: pd.DataFrame):
+    cache_filename = get_cached_manifest_filepath()
+    cache_directory = pathlib.Path(cache_filename).parents[0]
+    cache_directory.mkdir(parents=True, exist_ok=True)
+    manifest.to_csv(cache_filename, index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+
+def get_cached_list(url: str) -> Optional[dict]:
+    """
+    Get the cached remote list (the lines, along with the `etag` and the `timestamp` of the last validation), or `None` if it is not cached.
+    """
+    cache_filename = get_cached_list_filepath(url)
+    try:
+        with open(cache_filename) as fp:
+            return json.load(fp)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def set_cached_list(url: str, entry: dict):
+    cache_filename = get_cached_list_filepath(url)
+    cache_directory = pathlib.Path(cache_filename).parents[0]
+    cache_directory.mkdir(parents=True, exist_ok=True)
+    tmp_filename = f'{cache_filename}.{os.getpid()}.tmp'
+    with open(tmp_filename, 'w') as fp:
+        json.dump(dict(entry, url = url), fp)
+    os.replace(tmp_filename, cache_filename)
@@ -11,21 +11,34 @@ assert sys.version_info >= (3, 10)
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, help='Number of parallel workers (repositories to fetch, or report pages to render)', default=1)
+    parser.add_argument('--cache-format', help='Storage format of the cached commit histories (parquet requires pyarrow, CSV files are exported too)', choices=['csv', 'parquet', 'sqlite'], default='csv')
     parser_cache = parser.add_argument_group('Cache update')
     parser_cache.add_argument('--fetch', help='Update the cache', action='store_true', default=False)
     parser_cache.add_argument('--api', help='GitHub access token', default=None)
     parser_cache.add_argument('--repo', help='Run for a single repository (owner/name)', default=None)
     parser_cache.add_argument('--until', type=int, help='Only consider commits until the given year', default=None)
+    parser_cache.add_argument('--migrate-cache', help='Convert the cached commit histories to the given format', choices=['csv', 'parquet', 'sqlite'], default=None)
     parser_cache.add_argument('--list', help='List available repositories', action='store_true', default=False)
+    parser_cache.add_argument('--full', help='Walk the full commit history, instead of only the commits since the last run', action='store_true', default=False)
+    parser_cache.add_argument('--http-cache', help='Cache the responses of the GitHub API on disk (in cache/http)', action='store_true', default=False)
+    parser_cache.add_argument('--backend', help='Fetch commits via the GitHub REST API, the GitHub GraphQL API, or from local git mirrors', choices=['api', 'graphql', 'git'], default='api')
     parser_report = parser.add_argument_group('Report building')
     parser_report.add_argument('--report', help='Build the report', action='store_true', default=False)
+    parser_report.add_argument('--offline', help='Expand the remote lists of the communities only from cache (cache/lists)', action='store_true', default=False)
     args = parser.parse_args()
 
-    if not (args.fetch or args.report or args.list):
+    if not (args.fetch or args.report or args.list or args.migrate_cache):
         parser.print_help()
         print()
         parser.error('No action requested, add --fetch or --report')
 
+    from . import cache
+    cache.set_storage(args.cache_format)
+
+    if args.migrate_cache:
+        cache.migrate_commit_histories(args.migrate_cache)
+
     if args.fetch or args.list:
         from . import fetch
 
@@ -36,6 +49,10 @@ if __name__ == '__main__':
             else:
                 print('Using GitHub from $GITHUB_TOKEN')
 
+        if args.http_cache:
+            from . import httpcache
+            http_cache = httpcache.install()
+
         g: fetch.Github = fetch.Github(args.api)
         until = fetch.datetime(year=args.until, month=12, day=31, hour=23, minute=59, second=59) if args.until is not None else None
 
@@ -50,15 +67,16 @@ if __name__ == '__main__':
         if args.list:
             print('\n'.join([f'- {rinfo.url}' for rinfo in repositories]))
         else:
-            for ridx, rinfo in enumerate(repositories):
-                print(f'\n({ridx + 1}/{len(repositories)}) {rinfo.url} ↴')
-                fetch.get_commit_history(g, rinfo, until)
+            fetch.get_commit_histories(g, repositories, until, jobs=args.jobs, backend=args.backend, full=args.full)
 
             # Fetch avatars
             fetch.get_all_avatars(g)
 
+            if args.http_cache:
+                print(http_cache.get_stats())
+
     if args.report:
         from . import report
 
-        report.update()
+        report.update(jobs=args.jobs, offline=args.offline)
         report.build()
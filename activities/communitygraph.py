@@ -4,13 +4,16 @@ from datetime import (
 from typing import (
     Optional,
 )
+import heapq
+import itertools
 
 import numpy as np
 import pandas as pd
 import networkx as nx
 
 from .graphs import (
-    AvatarCache,
+    get_avatar_cache,
+    get_layout_cache,
     node_label_prefix,
     node_kwargs,
     filter_by_timestamp,
@@ -18,54 +21,85 @@ from .graphs import (
 
 
 def remove_edges_from(G, n):
-    for u, v in G.edges:
-        if u == n or v == n:
-            G.remove_edge(u, v)
+    """
+    Remove the edges of a node (using its adjacency list), and return its former neighbors.
+    """
+    neighbors = list(G.adj[n])
+    G.remove_edges_from([(n, m) for m in neighbors])
+    return neighbors
 
 
 def simplify_graph(G: nx.Graph, authors, repositories, avatar_cache, max_edges=50, max_nodes=np.inf):
+    """
+    Replace the edges of the nodes with the highest degrees by proxy nodes, until the graph is sufficiently simple.
+
+    The nodes are kept in a priority queue by their degrees (ties are broken by the order of the nodes in the graph, the outdated entries are skipped), so that only the nodes affected by an iteration need to be updated.
+    """
+    node_order = {n: idx for idx, n in enumerate(G.nodes)}
+    next_order = itertools.count(len(node_order))
+    queue = [(-deg, node_order[n], n) for n, deg in G.degree]
+    heapq.heapify(queue)
+    edge_count = G.number_of_edges()
+
+    def push(n):
+        heapq.heappush(queue, (-G.degree[n], node_order[n], n))
+
+    first_iteration = True
     while True:
-        
-        # Break when the graph is sufficiently simple
-        if len(G.edges) <= max_edges and len(G.nodes) <= max_nodes: break
 
-        # Choose the node with the highest degree
-        n, n_deg = max(G.degree, key=lambda n: n[1])
+        # Break when the graph is sufficiently simple
+        if edge_count <= max_edges and len(G.nodes) <= max_nodes: break
+
+        # Choose the node with the highest degree (skip outdated entries of the queue)
+        while True:
+            neg_deg, order, n = queue[0]
+            if node_order.get(n) == order and G.degree[n] == -neg_deg: break
+            heapq.heappop(queue)
+        n_deg = -neg_deg
         if n_deg == 2:
             break ## Nothing left to simplify here
 
         # Create proxy node
-        remove_edges_from(G, n)
+        neighbors = remove_edges_from(G, n)
+        edge_count -= len(neighbors) - neighbors.count(n) // 2  ## A self-loop is a single edge, but listed once as a neighbor
         if '/' in n:
             proxy = f'{node_label_prefix}{n_deg:d} contributors\n({100 * n_deg / len(authors):.0f}%)'
             proxy_type = 'author'
         else:
             proxy = f'{node_label_prefix}{n_deg:d} repositories\n({100 * n_deg / len(repositories):.0f}%)'
             proxy_type = 'repository'
+        if proxy not in node_order:
+            node_order[proxy] = next(next_order)  ## Added to the end of the nodes
         G.add_node(proxy, type=proxy_type, image=avatar_cache.get_filename('.blank'), **node_kwargs)
+        if not G.has_edge(proxy, n): edge_count += 1
         G.add_edge(proxy, n, headclip='false', tailclip='false')
 
-        # Remove disconnected nodes
-        disconnected_nodes = list()
-        for n in G.nodes:
-            if G.degree[n] == 0:
-                disconnected_nodes.append(n)
-        for n in disconnected_nodes:
-            G.remove_node(n)
+        # Remove disconnected nodes (only the former neighbors can have become disconnected, after all nodes were checked once)
+        candidates = list(G.nodes) if first_iteration else neighbors
+        disconnected_nodes = [m for m in dict.fromkeys(candidates) if m in G and G.degree[m] == 0]
+        for m in disconnected_nodes:
+            G.remove_node(m)
+            del node_order[m]
+        first_iteration = False
+
+        # Update the priorities of the affected nodes
+        for m in frozenset(neighbors + [n, proxy]):
+            if m in G: push(m)
 
 
-def render_community_graph(filepath: str, community_id: str, community_name: str, since: Optional[datetime]=None, until: Optional[datetime]=None):
-    df_community = pd.read_csv(f'report/_data/communities_data/{community_id}.csv')
+def render_community_graph(filepath: str, df_community: pd.DataFrame, community_name: str, since: Optional[datetime]=None, until: Optional[datetime]=None):
     df_community = filter_by_timestamp(df_community, first_day=since, last_day=until)
 
     # Get involed authors and repositories
-    df_community.author = df_community.author.fillna('')
-    df_community.repository = df_community.repository.fillna('')
+    df_community = df_community.assign(
+        author = df_community.author.astype(object).fillna(''),
+        repository = df_community.repository.astype(object).fillna(''),
+    )
     authors = np.unique([author for author in df_community['author'].tolist() if len(author) > 0])
     repositories = np.unique([repository for repository in df_community['repository'].tolist() if len(repository) > 0])
 
     # Get required avatars
-    avatar_cache = AvatarCache()
+    avatar_cache = get_avatar_cache()
     avatar_cache.load(authors, repositories)
 
     # Create graph
@@ -106,13 +140,11 @@ def render_community_graph(filepath: str, community_id: str, community_name: str
     A.node_attr.update(penwidth=0)
     A.edge_attr.update(penwidth=10)
     A.edge_attr.update(color='0 0 1')
-    A.layout(prog='neato')
 
     datetime_fmt = '%d.%m.%Y'
     since_str = pd.to_datetime(df_community.timestamp.min(), utc=True).strftime(datetime_fmt)
     until_str = pd.to_datetime(df_community.timestamp.max(), utc=True).strftime(datetime_fmt)
-    A.graph_attr.update(label=f'{community_name} ({since_str}–{until_str})')
+    label = f'{community_name} ({since_str}–{until_str})'
 
-    # Draw the graph
-    fmt = filepath.split('.')[-1].lower()
-    A.draw(path=filepath, format=fmt)
+    # Do the layout and draw the graph (the label is set after the layout)
+    get_layout_cache().draw(A, filepath, prog='neato', label=label)
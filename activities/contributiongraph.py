@@ -15,7 +15,8 @@ import pygraphviz as pgv
 from liquid import Template
 
 from .graphs import (
-    AvatarCache,
+    get_avatar_cache,
+    get_layout_cache,
     node_label_prefix,
     node_kwargs,
     filter_by_timestamp,
@@ -63,9 +64,8 @@ def get_unique_colors(n, sat=0.6, val=0.9):
     return [f'{hue:f} {sat:f} {val:f}' for hue in np.linspace(0, 1, num=n, endpoint=False)]
 
 
-def render_contribution_graph(filepath: str, contributor: str, since: Optional[datetime]=None, until: Optional[datetime]=None):
-    df_contributions = pd.read_csv(f'report/_data/contributors_data/{contributor}.csv')
-    df_contributions.repository = df_contributions.repository.fillna('')
+def render_contribution_graph(filepath: str, contributor: str, df_contributions: pd.DataFrame, since: Optional[datetime]=None, until: Optional[datetime]=None):
+    df_contributions = df_contributions.assign(repository = df_contributions.repository.astype(object).fillna(''))
     df_contributions = filter_by_timestamp(df_contributions, first_day=since, last_day=until)
 
     # Delete previous contributiongraph and drop out, if there were no contributions in the given timeframe
@@ -79,7 +79,7 @@ def render_contribution_graph(filepath: str, contributor: str, since: Optional[d
     repo_colors = dict(zip(repositories, get_unique_colors(len(repositories))))
 
     # Get required avatars
-    avatar_cache = AvatarCache()
+    avatar_cache = get_avatar_cache()
     avatar_cache.load([], repositories)
 
     # Compute timeline nodes and repository edges
@@ -154,7 +154,4 @@ def render_contribution_graph(filepath: str, contributor: str, since: Optional[d
     # Do the layout and draw the graph
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
-        fmt = filepath.split('.')[-1].lower()
-
-        G.layout(prog='dot')
-        G.draw(path=filepath, format=fmt)
+        get_layout_cache().draw(G, filepath, prog='dot')
@@ -0,0 +1,140 @@
+from . import cache
+
+import resource
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+import numpy as np
+import pandas as pd
+
+
+def get_peak_rss() -> int:
+    """
+    Get the peak resident set size of the current process (in bytes).
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  ## Reported in kilobytes on Linux
+
+
+def to_text(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a view of the corpus back to its text representation (as in the CSV files), e.g. for writing it to a CSV file.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.DatetimeTZDtype):
+            df[column] = df[column].astype(str)
+        elif isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(object)
+        elif column == 'tools':
+            df[column] = [cache.to_text_tools(tools) for tools in df[column].tolist()]
+    return df
+
+
+class Corpus:
+    """
+    The cached commit histories of all repositories, loaded once, along with the tool index (see `cache.to_tool_index`).
+
+    Timestamps are parsed (UTC), and authors, repositories, tools, and categories are categorical.
+    The tools of the commits are kept as they were loaded (parsed, if the storage backend reads typed columns, see `to_text`).
+    Views of the commits by repositories and by contributor are cheap, because the positions of the groups are computed only once (use `graphs.filter_by_timestamp` for views by time window).
+    """
+
+    def __init__(self, commits: pd.DataFrame, tools: pd.DataFrame, memory_budget: int=2 * 1024 ** 3):
+        """
+        Create the corpus from the commits in text or typed representation, and the tool index (both with a `repository` column, see `cache.query_cached_commit_history` and `cache.query_cached_commit_history_typed`).
+        """
+        commits = commits.assign(
+            author = commits['author'].astype('category'),
+            timestamp = pd.to_datetime(commits['timestamp'], utc=True).astype('datetime64[ns, UTC]'),  ## No-op for typed commits
+            repository = commits['repository'].astype('category'),
+        )
+
+        # Map the rows of the tool index to the positions of the commits
+        tools = tools.assign(timestamp = pd.to_datetime(tools['timestamp'], utc=True).astype('datetime64[ns, UTC]'))
+        tools = tools.merge(commits[['repository', 'timestamp', 'sha']].astype(dict(repository = str, sha = str)).assign(commit = np.arange(len(commits))), on=['repository', 'timestamp', 'sha'])
+
+        self.commits = commits
+        self.tools = pd.DataFrame(dict(
+            commit = tools['commit'].values,
+            repository = tools['repository'].astype('category').values,
+            tool = tools['tool'].astype('category').values,
+            category = tools['category'].astype('category').values,
+        ))
+
+        # Positions of the commits of each repository
+        self.repository_positions: Dict[str, np.ndarray] = self.commits.groupby('repository', observed=True, sort=False).indices
+
+        # Sort the commits by contributor once (the sort is stable, so the commits of each contributor remain in order), so that each contributor is a contiguous range
+        codes = self.commits['author'].cat.codes.values
+        self.contributor_order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[self.contributor_order], np.arange(len(self.commits['author'].cat.categories) + 1))
+        self.contributor_ranges: Dict[str, Tuple[int, int]] = {
+            contributor: (bounds[code], bounds[code + 1])
+            for code, contributor in enumerate(self.commits['author'].cat.categories)
+            if len(contributor) > 0 and bounds[code + 1] > bounds[code]  ## Commits without an author are not attributed to any contributor
+        }
+
+        self.memory_budget = memory_budget
+        if self.get_memory_usage() > memory_budget:
+            print(f'*** Corpus exceeds memory budget: {self.get_memory_usage() / 1024 ** 2:.0f} MB > {memory_budget / 1024 ** 2:.0f} MB')
+
+    @staticmethod
+    def from_cache(repositories: Optional[List[str]]=None, memory_budget: int=2 * 1024 ** 3) -> 'Corpus':
+        """
+        Load the cached commit histories of the given repositories (all by default).
+
+        The typed columns are used directly if the storage backend reads them (e.g., Parquet), instead of parsing the text representation.
+        """
+        if cache.storage.typed:
+            commits = cache.query_cached_commit_history_typed(repositories)
+        else:
+            commits = cache.query_cached_commit_history(repositories)
+        return Corpus(commits, cache.query_cached_tool_index(repositories), memory_budget)
+
+    def get_memory_usage(self) -> int:
+        """
+        Get the memory used by the commits and the tool index (in bytes).
+        """
+        return int(self.commits.memory_usage(deep=True).sum() + self.tools.memory_usage(deep=True).sum())
+
+    def get_repositories_positions(self, repositories: List[str]) -> np.ndarray:
+        positions = [self.repository_positions[repo] for repo in repositories if repo in self.repository_positions]
+        return np.concatenate(positions) if len(positions) > 0 else np.zeros(0, int)
+
+    def get_repositories(self, repositories: List[str]) -> pd.DataFrame:
+        """
+        Get the commits of the given repositories (in the order of the repositories).
+        """
+        return self.commits.iloc[self.get_repositories_positions(repositories)]
+
+    def get_contributor(self, contributor: str) -> pd.DataFrame:
+        """
+        Get the commits of a contributor.
+        """
+        start, end = self.contributor_ranges.get(contributor, (0, 0))
+        return self.commits.iloc[self.contributor_order[start:end]]
+
+    def get_contributors(self) -> List[str]:
+        """
+        Get the authors of the commits (in the order of their first commit in the corpus).
+        """
+        return [contributor for contributor in self.commits['author'].dropna().drop_duplicates().tolist() if contributor in self.contributor_ranges]
+
+    def iter_contributors(self) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """
+        Yield the commits of each contributor, one contributor at a time (see `get_contributors`).
+        """
+        for contributor in self.get_contributors():
+            yield contributor, self.get_contributor(contributor)
+
+    def get_tools(self, repositories: List[str]) -> pd.DataFrame:
+        """
+        Get the rows of the tool index, which correspond to the commits of the given repositories.
+        """
+        return self.tools[self.tools['repository'].isin(repositories)]
+
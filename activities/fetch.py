@@ -8,7 +8,13 @@ import json
 import urllib.request
 import collections
 import random
+import threading
+import time
 import warnings
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    as_completed,
+)
 from datetime import (
     datetime,
     timedelta,
@@ -20,8 +26,8 @@ from typing import (
     FrozenSet,
     Set,
     Tuple,
+    Dict,
     Optional,
-    Callable,
 )
 
 import pandas as pd
@@ -34,6 +40,7 @@ from github.ContentFile import ContentFile
 from github.Repository import Repository
 from github.Commit import Commit
 from github.GithubException import (
+    GithubException,
     IncompletableObject,
     UnknownObjectException,
 )
@@ -61,12 +68,15 @@ class RepositoryInfo:
         self.url = url
         self.scan_tools = scan_tools
 
-    def get_repository(self, g: Github):
+    def get_owner_name(self) -> Tuple[str, str]:
         assert self.url.lower().startswith(GITHUB_URL.lower()), f'Invalid URL: {self.url}'
         url = self.url[len(GITHUB_URL):]
         url_match = re.match(GITHUB_REPOSITORY_PATTERN, url)
         assert url_match is not None, f'Invalid URL pattern: {self.url}'
-        owner, name = url_match.group(1), url_match.group(2)
+        return url_match.group(1), url_match.group(2)
+
+    def get_repository(self, g: Github):
+        owner, name = self.get_owner_name()
         try:
             return g.get_repo(f'{owner}/{name}')
         except UnknownObjectException:
@@ -103,23 +113,246 @@ def get_github_repositories(g: Github) -> List[str]:
     return repo_list
 
 
+def get_repository_heads(g: Github, repositories: List[RepositoryInfo], batch_size: int=50) -> Dict[str, dict]:
+    """
+    Get the time of the last push and the SHA of the HEAD of the default branch, for multiple repositories at once.
+
+    The information is queried using batched GraphQL requests, and returned as dictionaries (with the keys `repository`, `pushed_at`, `head_sha`) keyed by the repository URLs.
+    Repositories which could not be queried are missing in the result.
+    """
+    heads: Dict[str, dict] = dict()
+    for batch_start in range(0, len(repositories), batch_size):
+        batch = repositories[batch_start : batch_start + batch_size]
+        query_parts = list()
+        for ridx, rinfo in enumerate(batch):
+            owner, name = rinfo.get_owner_name()
+            if name.endswith('.git'): name = name[:-4]
+            query_parts.append(
+                f'r{ridx}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) '
+                '{ nameWithOwner pushedAt defaultBranchRef { target { oid } } }'
+            )
+        query = 'query { ' + ' '.join(query_parts) + ' }'
+
+        # Repositories which are not found yield errors, but the data of the others is still returned
+        try:
+            _, data = g.requester.graphql_query(query, dict())
+        except GithubException as error:
+            data = error.data if isinstance(error.data, dict) else dict()
+        data = data.get('data') or dict()
+
+        for ridx, rinfo in enumerate(batch):
+            repo_data = data.get(f'r{ridx}')
+            if repo_data is None or repo_data.get('defaultBranchRef') is None: continue
+            heads[rinfo.url] = dict(
+                repository = repo_data['nameWithOwner'],
+                pushed_at = repo_data['pushedAt'],
+                head_sha = repo_data['defaultBranchRef']['target']['oid'],
+            )
+    return heads
+
+
+def schedule_repositories(g: Github, repositories: List[RepositoryInfo]) -> List[RepositoryInfo]:
+    """
+    Skip the repositories whose HEAD has not moved since the last successful fetch, and order the others by their recent activity (most recent first).
+    """
+    heads = get_repository_heads(g, repositories)
+    with manifest_lock:
+        manifest = cache.get_cached_manifest()
+    manifest_heads = dict(zip(manifest['repository'].tolist(), manifest['head_sha'].tolist()))
+
+    scheduled: List[RepositoryInfo] = list()
+    skipped: List[RepositoryInfo] = list()
+    for rinfo in repositories:
+        head = heads.get(rinfo.url)
+        if (
+            head is not None and
+            manifest_heads.get(head['repository']) == head['head_sha'] and
+            pathlib.Path(cache.get_cached_repository_filepath(head['repository'])).is_file()
+        ):
+            skipped.append(rinfo)
+        else:
+            scheduled.append(rinfo)
+    print(f'Skipping {len(skipped)} unchanged repositories ({len(scheduled)} remaining)')
+
+    # Repositories with unknown activity are scheduled last
+    scheduled.sort(key=lambda rinfo: heads.get(rinfo.url, dict()).get('pushed_at') or '', reverse=True)
+    return scheduled
+
+
 def is_subpath(subpath: Union[pathlib.Path, str], path: pathlib.Path) -> bool:
     return str(subpath) in [str(path)] + [str(p) for p in path.parents[:-1]]
 
 
-def get_tool_directories(repository: Repository, commit: Commit, status: Optional[tqdm]=None) -> FrozenSet[str]:
+class RateLimitBudget:
+    """
+    Rate limit budget shared by all workers that use the same GitHub instance.
+
+    The remaining number of requests and the reset time are read from the headers of the last response, as reported by PyGithub.
+    If the remaining number of requests drops to the reserve, all workers are blocked until the rate limit is reset.
+    """
+
+    def __init__(self, g: Github, reserve: int=20):
+        self.g = g
+        self.reserve = reserve
+        self.lock = threading.Lock()
+
+    def throttle(self, status: Optional[tqdm]=None):
+        with self.lock:
+            remaining, _ = self.g.rate_limiting
+            if remaining > self.reserve: return
+
+            # Wait until the rate limit is reset (the lock is held, so that all other workers wait too)
+            resettime = datetime.fromtimestamp(self.g.rate_limiting_resettime, timezone.utc)
+            if status is not None: status.set_description_str(f'Rate limit exhausted, waiting until {resettime.strftime("%H:%M:%S")} UTC')
+            wait_seconds = (resettime - datetime.now(timezone.utc)).total_seconds() + 1
+            if wait_seconds > 0:
+                time.sleep(wait_seconds)
+
+
+def get_tool_directories(repository: Repository, commit: Commit, status: Optional[tqdm]=None) -> Dict[str, Optional[str]]:
+    """
+    Get the tool directories of a commit, along with the blob SHAs of their shed files.
+    """
     if status is not None: status.set_description_str('Fetching tree')
     try:
         tree = repository.get_git_tree(sha=commit.sha, recursive=True)
-        return frozenset([str(pathlib.Path(te.path).parents[0]) for te in tree.tree if te.path.endswith('/' + SHED_FILENAME)])
+        return {str(pathlib.Path(te.path).parents[0]): te.sha for te in tree.tree if te.path.endswith('/' + SHED_FILENAME)}
     except UnknownObjectException:
-        return frozenset()
+        return dict()
+
+
+def is_shed_filepath(filepath: Optional[str]) -> bool:
+    return filepath is not None and filepath.endswith('/' + SHED_FILENAME)
+
+
+class ToolDirectoryTracker:
+    """
+    Keeps track of the tool directories while the commit history is walked backwards in time.
+
+    The tool directories of a commit are derived from those of its child, by reverting the changes of the shed files made by the child.
+    The full directory tree is only fetched, if the tool directories cannot be derived (e.g., for the first commit, after merge commits, or when commits were skipped).
+    Along with each tool directory, the blob SHA of its shed file is tracked, or `None` if it is not known.
+    """
+
+    # Maximum number of files reported for a commit by the GitHub API
+    MAX_COMMIT_FILES = 3000
+
+    def __init__(self, repository: Repository):
+        self.repository = repository
+        self.commit: Optional[Commit] = None
+        self.tool_directories: Optional[Dict[str, Optional[str]]] = None
+        self.tree_fetches: int = 0
+        self.tree_fetches_saved: int = 0
+
+    def revert_changes(self, tool_directories: Dict[str, Optional[str]], commit: Commit) -> Optional[Dict[str, Optional[str]]]:
+        """
+        Get the tool directories of the parent of a commit, or `None` if they cannot be determined.
+        """
+        files = list(commit.files)
+        if len(files) >= self.MAX_COMMIT_FILES: return None
+        tool_directories = dict(tool_directories)
+        for file in files:
+            if file.status == 'unchanged': continue
+            if file.status in ('modified', 'changed'):
+                if is_shed_filepath(file.filename):
+                    tool_directories[str(pathlib.Path(file.filename).parents[0])] = None
+            elif file.status in ('added', 'copied', 'renamed'):
+                if is_shed_filepath(file.filename):
+                    tool_directories.pop(str(pathlib.Path(file.filename).parents[0]), None)
+                if file.status == 'renamed' and is_shed_filepath(file.previous_filename):
+                    tool_directories[str(pathlib.Path(file.previous_filename).parents[0])] = None
+            elif file.status == 'removed':
+                if is_shed_filepath(file.filename):
+                    tool_directories[str(pathlib.Path(file.filename).parents[0])] = None
+            else:
+                return None  ## Unknown status, cannot resolve the changes
+        return tool_directories
+
+    def update(self, commit: Commit):
+        """
+        Advance to the next commit (must be called for every commit, in the order of the walk).
+        """
+        tool_directories = None
+        if self.commit is not None and self.tool_directories is not None:
+            parents = self.commit.parents
+            if len(parents) == 1 and parents[0].sha == commit.sha:
+                tool_directories = self.revert_changes(self.tool_directories, self.commit)
+        self.commit = commit
+        self.tool_directories = tool_directories
+
+    def get(self, status: Optional[tqdm]=None) -> Dict[str, Optional[str]]:
+        """
+        Get the tool directories of the current commit, fetching the full tree only if required.
+        """
+        if self.tool_directories is None:
+            self.tool_directories = get_tool_directories(self.repository, self.commit, status)
+            self.tree_fetches += 1
+        else:
+            self.tree_fetches_saved += 1
+        return self.tool_directories
+
+
+def parse_shed_categories(shed_file: str) -> Optional[List[str]]:
+    """
+    Read the tool categories from the contents of a shed file, or `None` if the shed file is not valid.
+    """
+    try:
+        shed_data = yaml.safe_load(shed_file)
+        assert shed_data is not None
+        categories = shed_data.get('categories')
+        assert categories is not None and all(map(lambda item: isinstance(item, str), categories))
+        return list(sorted(categories))
+
+    # The file is not valid YAML or otherwise malformed
+    except (yaml.YAMLError, AssertionError):
+        return None
 
 
-def get_updated_tools(repository: Repository, commit: Commit, tool_directories: FrozenSet[str], status: Optional[tqdm]=None) -> List[dict]:
+class ShedFileCache:
+    """
+    Persistent cache of the tool categories read from shed files, keyed by the blob SHAs of the shed files.
+
+    Since a blob SHA identifies the contents of a file, each shed file needs to be downloaded and parsed only once.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        df = cache.get_cached_shed_files()
+        self.categories: Dict[str, Optional[List[str]]] = {
+            sha: json.loads(categories) if len(categories) > 0 else None
+            for sha, categories in zip(df['sha'].tolist(), df['categories'].tolist())
+        }
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __contains__(self, sha: Optional[str]) -> bool:
+        return sha is not None and sha in self.categories
+
+    def get(self, sha: str) -> Optional[List[str]]:
+        return self.categories[sha]
+
+    def put(self, sha: str, categories: Optional[List[str]]):
+        with self.lock:
+            self.categories[sha] = categories
+
+    def save(self):
+        with self.lock:
+            shas = list(sorted(self.categories.keys()))
+            df = pd.DataFrame(dict(
+                sha = shas,
+                categories = [json.dumps(self.categories[sha]) if self.categories[sha] is not None else '' for sha in shas],
+            ))
+            cache.set_cached_shed_files(df)
+
+
+def get_updated_tools(repository: Repository, commit: Commit, tool_directories: Dict[str, Optional[str]], status: Optional[tqdm]=None, shed_files: Optional[ShedFileCache]=None) -> List[dict]:
     """
     Get list of the tools for which tools have been added, updated, or removed.
+
+    Shed files are only downloaded if their blob SHA is not known from `tool_directories`, or not found in the `shed_files` cache.
+    Blob SHAs learned from downloads are recorded in `tool_directories`.
     """
+    if shed_files is None: shed_files = ShedFileCache()
     updated_tools: List[str] = list()
     read_shed_files: Set[str] = set()
 
@@ -127,28 +360,28 @@ def get_updated_tools(repository: Repository, commit: Commit, tool_directories:
         for directory in pathlib.Path(file.filename).parents[:-1]:
             if str(directory) in tool_directories:
                 shed_filepath = str(directory / SHED_FILENAME)
-                if status is not None: status.set_description_str(f'Peeking {shed_filepath}')
-                shed_file = get_string_content(repository.get_contents(shed_filepath, ref=commit.sha))
+                shed_sha = tool_directories[str(directory)]
+                if shed_sha in shed_files:
+                    shed_files.hits += 1
+                else:
+                    shed_files.misses += 1
+                    if status is not None: status.set_description_str(f'Peeking {shed_filepath}')
+                    cf = repository.get_contents(shed_filepath, ref=commit.sha)
+                    shed_sha = cf.sha
+                    tool_directories[str(directory)] = shed_sha
+                    if shed_sha not in shed_files:
+                        shed_files.put(shed_sha, parse_shed_categories(get_string_content(cf)))
 
                 # Make sure each tool (shed file) is processed only once
-                if shed_file in read_shed_files: continue
-                read_shed_files.add(shed_file)
-
-                # Read the updated tool categories and add to set
-                try:
-                    shed_data = yaml.safe_load(shed_file)
-                    assert shed_data is not None
-                    categories = shed_data.get('categories')
-                    assert categories is not None and all(map(lambda item: isinstance(item, str), categories))
+                if shed_sha in read_shed_files: continue
+                read_shed_files.add(shed_sha)
 
-                    # Record the tool if reading the categories was successful, i.e. the shed file is valid
-                    tool = dict(name = directory.name, categories = list(sorted(categories)))
+                # Record the tool if reading the categories was successful, i.e. the shed file is valid
+                categories = shed_files.get(shed_sha)
+                if categories is not None:
+                    tool = dict(name = directory.name, categories = categories)
                     updated_tools.append(tool)
 
-                # Do nothing if the file is not valid YAML or otherwise malformed
-                except (yaml.YAMLError, AssertionError):
-                    pass
-
                 # We are done with this file, since a shed file was found
                 break
 
@@ -164,16 +397,34 @@ class process_new_commits:
     New commits are determined by comparing each commit to the stock of previously known commits.
     The comparison is performed using the short SHA along with the datetime of the commits.
     The stock of previously known commits is represented by a pandas dataframe, and is expected to contain at least the columns `sha` and `timestamp`, where the values in the `timestamp` column correspond to the `str` representation of the datetime of each commit.
+
+    If the SHA of the HEAD from the last run is given (and no `until` datetime), the walk is incremental:
+    Only commits since the newest previously known commit (the watermark) are listed, and the walk stops as soon as the previous HEAD is reached.
+    Commits with a commit date older than the watermark (e.g., from long-lived branches merged afterwards) are only found by a full walk.
+    The SHA of the current HEAD is available as `head_sha` after the walk.
+
+    Commits recovered from the checkpoints of an interrupted walk can be passed as `resumed_commits`.
+    These are not yielded again, but do not move the watermark either (older commits might still be missing).
     """
 
-    def __init__(self, repository: Repository, previous_commits: pd.DataFrame, until: Optional[datetime]=None):
+    def __init__(self, repository: Repository, previous_commits: pd.DataFrame, until: Optional[datetime]=None, budget: Optional[RateLimitBudget]=None, position: int=0, desc: Optional[str]=None, head_sha: Optional[str]=None, resumed_commits: Optional[pd.DataFrame]=None):
         self.repository = repository
         self.previous_commits = previous_commits
+        self.resumed_commits = resumed_commits
         self.until = until
+        self.budget = budget
+        self.position = position
+        self.desc = desc
         self.status = None
+        self.previous_head_sha = head_sha
+        self.head_sha = None
+
+    @property
+    def incremental(self) -> bool:
+        return self.previous_head_sha is not None and self.until is None and len(self.previous_commits) > 0
 
     def __iter__(self):
-        previous_commits_list = self.previous_commits[['sha', 'timestamp']].apply(tuple, axis=1).tolist()
+        previous_commits_list = list(zip(self.previous_commits['sha'].tolist(), self.previous_commits['timestamp'].tolist()))
         previous_commits_set = frozenset(previous_commits_list)
         try:
             assert len(self.previous_commits) == len(previous_commits_set), f'{len(self.previous_commits)} != {len(previous_commits_set)}'
@@ -184,18 +435,36 @@ class process_new_commits:
                     print(f'- {c[0]} {c[1]}')
             print('')
             raise
-        
-        get_commits_kwargs = dict(until=self.until) if self.until is not None else dict()
-        commits = self.repository.get_commits(**get_commits_kwargs)
-        new_commits_count = commits.totalCount - len(previous_commits_set)
+
+        # Commits recovered from checkpoints are known as well
+        if self.resumed_commits is not None:
+            previous_commits_set |= frozenset(zip(self.resumed_commits['sha'].tolist(), self.resumed_commits['timestamp'].tolist()))
+
+        # List only the commits since the watermark (the number of new commits is unknown)
+        if self.incremental:
+            watermark = pd.to_datetime(self.previous_commits['timestamp'], utc=True).max()
+            commits = self.repository.get_commits(since=watermark.to_pydatetime())
+            new_commits_count = None
+
+        # List all commits (the number of new commits is known from the total number)
+        else:
+            get_commits_kwargs = dict(until=self.until) if self.until is not None else dict()
+            commits = self.repository.get_commits(**get_commits_kwargs)
+            new_commits_count = commits.totalCount - len(previous_commits_set)
+
         new_commits_processed = 0
 
         try:
-            pbar = tqdm(total=new_commits_count, position=0)
-            self.status = tqdm(total=0, bar_format='{desc}', position=1)
+            # Progress bars of parallel workers are removed once finished, so that they do not pile up
+            leave = (self.position == 0)
+            pbar = tqdm(total=new_commits_count, desc=self.desc, position=self.position, leave=leave)
+            self.status = tqdm(total=0, bar_format='{desc}', position=self.position + 1, leave=leave)
 
             for c in commits:
-                if new_commits_processed >= new_commits_count: break
+                if self.head_sha is None and self.until is None: self.head_sha = c.sha
+                if new_commits_count is not None and new_commits_processed >= new_commits_count: break
+                if self.incremental and c.sha == self.previous_head_sha: break
+                if self.budget is not None: self.budget.throttle(self.status)
 
                 short_sha = c.sha[:7]
                 pbar.set_postfix_str(short_sha)
@@ -214,6 +483,33 @@ class process_new_commits:
             self.status = None
 
 
+# Guards the read-modify-write of the fetch manifest, which is shared by all workers
+manifest_lock = threading.Lock()
+
+
+def get_manifest_entry(repository: Union[str, Repository]) -> dict:
+    """
+    Get the information recorded for a repository by the last successful fetch (empty, if there is none).
+    """
+    repo = repository if isinstance(repository, str) else repository.full_name
+    with manifest_lock:
+        df = cache.get_cached_manifest()
+    rows = df[df['repository'] == repo].to_dict('records')
+    return rows[0] if len(rows) > 0 else dict()
+
+
+def update_manifest_entry(repository: Union[str, Repository], **values):
+    repo = repository if isinstance(repository, str) else repository.full_name
+    with manifest_lock:
+        df = cache.get_cached_manifest()
+        entry = df[df['repository'] == repo].to_dict('records')
+        entry = entry[0] if len(entry) > 0 else dict(repository = repo)
+        entry.update(values)
+        df = pd.concat([df[df['repository'] != repo], pd.DataFrame([entry])])
+        df.sort_values('repository', inplace=True)
+        cache.set_cached_manifest(df)
+
+
 def get_commit_author(commit: Commit) -> Optional[str]:
     if commit.author is None:
         return None
@@ -224,29 +520,64 @@ def get_commit_author(commit: Commit) -> Optional[str]:
             return None
 
 
-def get_commit_history(g: Github, rinfo: RepositoryInfo, until: Optional[datetime]=None) -> pd.DataFrame:
-    repository = rinfo.get_repository(g)
-    cached_df = cache.get_cached_commit_history(repository)
-    new_entries = {c: list() for c in cached_df.columns}
+class CommitCheckpointer:
+    """
+    Periodically writes the new entries of a commit walk to append-only delta segments.
 
-    # Currently known tool directories, initially unknown
-    tool_directories: FrozenSet[str] = None
+    A segment is written after every `every_commits` new commits, or after `every_seconds` seconds (whichever comes first).
+    If the walk is interrupted, the next walk resumes from the segments.
+    """
 
-    # Number of commits back in time, since shed files were last modified
-    shed_age: int = 0
+    def __init__(self, repository: Repository, every_commits: int=100, every_seconds: float=300):
+        self.repository = repository
+        self.every_commits = every_commits
+        self.every_seconds = every_seconds
+        self.written_count: int = 0
+        self.written_time: float = time.monotonic()
+
+    def update(self, new_entries: dict):
+        count = len(new_entries['sha'])
+        if count == self.written_count: return
+        if count - self.written_count >= self.every_commits or time.monotonic() - self.written_time >= self.every_seconds:
+            segment = pd.DataFrame({column: values[self.written_count:] for column, values in new_entries.items()})
+            cache.append_checkpoint_segment(self.repository, segment)
+            self.written_count = count
+            self.written_time = time.monotonic()
+
+
+def get_commit_history(g: Github, rinfo: RepositoryInfo, until: Optional[datetime]=None, budget: Optional[RateLimitBudget]=None, position: int=0, desc: Optional[str]=None, shed_files: Optional[ShedFileCache]=None, backend: str='api', full: bool=False) -> pd.DataFrame:
+    """
+    Fetch the new commits of a repository and update the cache.
 
-    for commit, short_sha, datetime in (pnc := process_new_commits(repository, cached_df, until)):
+    The commits are either fetched via the GitHub REST API (`backend='api'`), the GitHub GraphQL API (`backend='graphql'`), or extracted from a local mirror of the repository (`backend='git'`).
+    Unless `full` is set, only the commits since the last run are walked (see `process_new_commits`).
+    """
+    assert backend in ('api', 'graphql', 'git'), f'Unknown backend: {backend}'
+    if shed_files is None: shed_files = ShedFileCache()
+    repository = rinfo.get_repository(g)
+    if backend == 'git':
+        from . import gitmirror
+        return gitmirror.get_commit_history(repository, rinfo, until, shed_files, position, desc)
+    if backend == 'graphql':
+        from . import graphql
+        return graphql.get_commit_history(g, repository, rinfo, until, shed_files, budget, position, desc, full)
+
+    cached_df = cache.get_cached_commit_history(repository)
+    new_entries = {c: list() for c in cached_df.columns}
 
-        # If a shed file is modified, then the tool directories become unknown without further inspection
-        if any([file.filename.endswith('/' + SHED_FILENAME) for file in commit.files]):
-            tool_directories = None
-            shed_age = 0
+    # Resume from the checkpoints of a previously interrupted walk (if any)
+    resumed_df = cache.get_checkpoint_segments(repository)
+    checkpointer = CommitCheckpointer(repository)
+    if len(resumed_df) > 0:
+        tqdm.write(f'{repository.full_name}: Resuming from {len(resumed_df)} checkpointed commits')
 
-        else:
+    # Tool directories are carried forward from commit to commit, instead of fetching the full tree for each
+    tool_directory_tracker = ToolDirectoryTracker(repository)
 
-            # Keep track of the number of commits back in time, since shed files were last modified
-            # Example: 1 means that `c` is the first commit since the last modification
-            shed_age += 1
+    head_sha = None if full else get_manifest_entry(repository).get('head_sha')
+    for commit, short_sha, datetime in (pnc := process_new_commits(repository, cached_df, until, budget, position, desc, head_sha, resumed_df)):
+        if rinfo.scan_tools:
+            tool_directory_tracker.update(commit)
 
         author: Optional[str] = get_commit_author(commit)
         if author is None:
@@ -259,8 +590,8 @@ def get_commit_history(g: Github, rinfo: RepositoryInfo, until: Optional[datetim
             # If enabled, fetch the directory tree and get list of updated tools
             updated_tool: List[dict]
             if rinfo.scan_tools:
-                tool_directories: FrozenSet[str]  = get_tool_directories(repository, commit, pnc.status)
-                updated_tools = get_updated_tools(repository, commit, tool_directories, pnc.status)
+                tool_directories: Dict[str, Optional[str]] = tool_directory_tracker.get(pnc.status)
+                updated_tools = get_updated_tools(repository, commit, tool_directories, pnc.status, shed_files)
             else:
                 updated_tools = list()
 
@@ -269,54 +600,202 @@ def get_commit_history(g: Github, rinfo: RepositoryInfo, until: Optional[datetim
 
         new_entries['timestamp'].append(str(datetime))
         new_entries['sha'].append(short_sha)
+        checkpointer.update(new_entries)
+
+    if rinfo.scan_tools:
+        tree_fetches = tool_directory_tracker.tree_fetches
+        tree_fetches_saved = tool_directory_tracker.tree_fetches_saved
+        tqdm.write(f'{repository.full_name}: {tree_fetches} tree fetches, {tree_fetches_saved} saved')
+        shed_files.save()
+
+    # The checkpointed commits are merged with the cache, and are then no longer needed
+    if len(resumed_df) > 0:
+        cached_df = pd.concat([cached_df, resumed_df]) if len(cached_df) > 0 else resumed_df
+        cached_df = cached_df.drop_duplicates(['timestamp', 'sha'])
+    history_df = update_commit_history(repository, cached_df, new_entries)
+    cache.clear_checkpoint_segments(repository)
+    if pnc.head_sha is not None:
+        update_manifest_entry(repository, head_sha = pnc.head_sha, pushed_at = str(repository.pushed_at))
+    return history_df
+
 
+def update_commit_history(repository: Union[str, Repository], cached_df: pd.DataFrame, new_entries: dict) -> pd.DataFrame:
+    """
+    Merge new entries (newest first) into the cached commit history of a repository, and write the cache.
+    """
     pk = ['timestamp', 'sha']
     new_entries_df = pd.DataFrame(new_entries).iloc[::-1].drop_duplicates(pk)
     history_df = pd.concat([cached_df, new_entries_df]) if len(cached_df) > 0 else new_entries_df
     history_df.sort_values(pk, inplace=True)
     cache.set_cached_commit_history(repository, history_df)
+    cache.set_cached_tool_index(repository, cache.to_tool_index(history_df))
     return history_df
 
 
-def get_avatars(g: Github, column: str, cache_df: pd.DataFrame, get_avatar_url: Callable[[str], str], cache_column: Optional[str]=None) -> pd.DataFrame:
-    if cache_column is None: cache_column = column
+def update_category_index():
+    """
+    Write the tool indices which are missing or outdated, and then the inverted category index of all repositories.
+    """
+    for repo in cache.get_cached_repositories():
+        if cache.is_cached_tool_index_outdated(repo):
+            cache.set_cached_tool_index(repo, cache.to_tool_index(cache.get_cached_commit_history(repo)))
+    cache.set_cached_category_index(cache.to_category_index(cache.query_cached_tool_index()))
+
+
+def get_commit_histories(g: Github, repositories: List[RepositoryInfo], until: Optional[datetime]=None, jobs: int=1, backend: str='api', full: bool=False):
+    """
+    Fetch the commit histories of multiple repositories, using `jobs` parallel workers.
+
+    All workers share a single rate limit budget. The cache of each repository is written as soon as it was fetched.
+    Unless `full` or `until` is set, repositories without new commits since the last run are skipped (see `schedule_repositories`).
+    """
+    if not full and until is None:
+        repositories = schedule_repositories(g, repositories)
+
+    budget = RateLimitBudget(g, reserve=20 * jobs)
+    shed_files = ShedFileCache()
+
+    # Fetch the repositories one after another
+    if jobs <= 1:
+        for ridx, rinfo in enumerate(repositories):
+            print(f'\n({ridx + 1}/{len(repositories)}) {rinfo.url} ↴')
+            get_commit_history(g, rinfo, until, budget, shed_files=shed_files, backend=backend, full=full)
+        print(f'\nShed files: {shed_files.hits} cached, {shed_files.misses} downloaded')
+        update_category_index()
+        return
+
+    # Each worker uses two lines for progress output (below the overall progress bar)
+    positions = list(range(1, 2 * jobs, 2))
+    positions_lock = threading.Lock()
+
+    def worker(rinfo: RepositoryInfo):
+        with positions_lock:
+            position = positions.pop(0)
+        try:
+            get_commit_history(g, rinfo, until, budget, position, desc=rinfo.url[len(GITHUB_URL):], shed_files=shed_files, backend=backend, full=full)
+        finally:
+            with positions_lock:
+                positions.append(position)
+
+    failed: List[Tuple[RepositoryInfo, Exception]] = list()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(worker, rinfo): rinfo for rinfo in repositories}
+        with tqdm(total=len(futures), desc='Repositories', position=0) as pbar:
+            for future in as_completed(futures):
+                rinfo = futures[future]
+                try:
+                    future.result()
+                except Exception as error:
+                    tqdm.write(f'*** Failed to fetch {rinfo.url}: {error}')
+                    failed.append((rinfo, error))
+                pbar.update(1)
+
+    print(f'\nShed files: {shed_files.hits} cached, {shed_files.misses} downloaded')
+    update_category_index()
 
-    repositories = cache.get_cached_repositories()
-    values: Set[str] = set()
-    for repo in repositories:
-        df = pd.read_csv(f'cache/repositories/{repo}.csv')
-        df['repository'] = repo
-        df[column] = df[column].fillna('')
-        values |= frozenset([value.lower() for value in df[column].values.tolist() if len(value) > 0])
+    # Report the failed repositories (the cache of all other repositories is already written)
+    if len(failed) > 0:
+        raise failed[0][1]
 
-    cache_data = {item[0]: item[1].tolist() for item in cache_df.to_dict('series').items()}
 
-    now = datetime.now(timezone.utc)
-    for value in tqdm(values, desc=f'Fetching "{column}" avatars'):
-        sel = (cache_df[cache_column] == value)
-        if sel.any():
-            cache_row = cache_df[sel]
-            if len(cache_row['avatar_url'].tolist()[0]) == 0: continue
-            timestamp = pd.to_datetime(cache_row['timestamp'].tolist()[0], utc=True)
-            if timestamp > now: continue
+def get_avatar_url(g: Github, login: str) -> str:
+    """
+    Get the avatar URL of a user or organization using the REST API (an empty string, if the login does not exist).
+    """
+    try:
+        return g.get_user(login).avatar_url
+    except UnknownObjectException:
+        return ''
+
+
+def get_avatar_urls(g: Github, logins: List[str], batch_size: int=100) -> Dict[str, str]:
+    """
+    Get the avatar URLs of users or organizations, using batched GraphQL requests.
+
+    Logins which do not exist are mapped to an empty string, and logins which could not be queried are missing in the result.
+    Falls back to one REST request per login, if the GraphQL API is not available (e.g., without a GitHub token), or if a login is not found (e.g., bots like `dependabot[bot]` are no repository owners).
+    """
+    avatar_urls: Dict[str, str] = dict()
+    for batch_start in tqdm(range(0, len(logins), batch_size), desc='Fetching avatars'):
+        batch = logins[batch_start : batch_start + batch_size]
+        query_parts = [f'a{lidx}: repositoryOwner(login: {json.dumps(login)}) {{ avatarUrl }}' for lidx, login in enumerate(batch)]
+        query = 'query { ' + ' '.join(query_parts) + ' }'
 
+        # Logins which are not found yield errors, but the data of the others is still returned
         try:
-            avatar_url = get_avatar_url(value)
-            cache_data['avatar_url'].append(avatar_url)
-        except UnknownObjectException:
-            cache_data['avatar_url'].append('')
+            _, data = g.requester.graphql_query(query, dict())
+        except GithubException as error:
+            data = error.data if isinstance(error.data, dict) else dict()
 
-        cache_data[cache_column].append(value)
-        cache_data['timestamp'].append(now + timedelta(days=7 + random.randint(0, 23)))
+        if data.get('data') is None:
+            for login in batch:
+                avatar_urls[login] = get_avatar_url(g, login)
+            continue
 
-    cache_df = pd.DataFrame(cache_data)
-    cache_df.drop_duplicates(subset=[cache_column], keep='last', inplace=True)
-    cache_df.sort_values(cache_column, inplace=True)
-    return cache_df
+        not_found = frozenset(error['path'][0] for error in data.get('errors', list()) if error.get('type') == 'NOT_FOUND' and error.get('path'))
+        for lidx, login in enumerate(batch):
+            owner_data = data['data'].get(f'a{lidx}')
+            if owner_data is not None:
+                avatar_urls[login] = owner_data['avatarUrl']
+            elif f'a{lidx}' in not_found:
+                avatar_urls[login] = get_avatar_url(g, login)
+    return avatar_urls
 
 
 def get_all_avatars(g: Github) -> pd.DataFrame:
+    """
+    Update the cached avatar URLs of all authors and repositories (the avatar of a repository is the avatar of its owner).
+
+    Cached avatar URLs are refreshed after they expire, and missing avatars are not fetched again.
+    """
     cache_df = cache.get_cached_avatars()
-    cache_df = get_avatars(g, 'author', cache_df, lambda author: g.get_user(author).avatar_url, 'name')
-    cache_df = get_avatars(g, 'repository', cache_df, lambda repository: g.get_repo(repository).owner.avatar_url, 'name')
+    avatars: Dict[str, Tuple[str, object]] = {
+        name: (avatar_url, timestamp) for name, avatar_url, timestamp in zip(cache_df['name'].tolist(), cache_df['avatar_url'].tolist(), cache_df['timestamp'].tolist())
+    }
+
+    # Read the authors and repositories from the cache
+    authors: Set[str] = set()
+    repositories: Set[str] = set()
+    for repo in cache.get_cached_repositories():
+        df = cache.get_cached_commit_history(repo)
+        authors |= frozenset([author.lower() for author in df['author'].fillna('').tolist() if len(author) > 0])
+        repositories.add(repo.lower())
+
+    # Determine the avatars which need to be fetched
+    now = datetime.now(timezone.utc)
+    def is_expired(name: str) -> bool:
+        if name not in avatars: return True
+        avatar_url, timestamp = avatars[name]
+        return len(avatar_url) > 0 and pd.to_datetime(timestamp, utc=True) <= now
+    expired_authors = [author for author in sorted(authors) if is_expired(author)]
+    expired_repositories = [repo for repo in sorted(repositories) if is_expired(repo)]
+
+    # Fetch the avatars of the authors and of the repository owners (each owner only once)
+    owners = frozenset(repo.split('/')[0] for repo in expired_repositories)
+    avatar_urls = get_avatar_urls(g, sorted(frozenset(expired_authors) | owners))
+
+    get_expiration = lambda: now + timedelta(days=7 + random.randint(0, 23))
+    for author in expired_authors:
+        if author in avatar_urls:
+            avatars[author] = (avatar_urls[author], get_expiration())
+    for repo in expired_repositories:
+        owner_avatar_url = avatar_urls.get(repo.split('/')[0])
+        if owner_avatar_url is None: continue
+
+        # The owner was not found (e.g., it was renamed), so the repository is looked up instead
+        if len(owner_avatar_url) == 0:
+            try:
+                owner_avatar_url = g.get_repo(repo).owner.avatar_url
+            except UnknownObjectException:
+                pass
+
+        avatars[repo] = (owner_avatar_url, get_expiration())
+
+    names = list(sorted(avatars.keys()))
+    cache_df = pd.DataFrame(dict(
+        name = names,
+        avatar_url = [avatars[name][0] for name in names],
+        timestamp = [avatars[name][1] for name in names],
+    ))
     cache.set_cached_avatars(cache_df)
+    return cache_df
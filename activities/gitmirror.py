@@ -0,0 +1,284 @@
+from . import cache
+from .fetch import (
+    SHED_FILENAME,
+    RepositoryInfo,
+    ShedFileCache,
+    get_commit_author,
+    parse_shed_categories,
+    update_commit_history,
+    update_manifest_entry,
+)
+
+import pathlib
+import csv
+import json
+import re
+import subprocess
+import threading
+import collections
+from datetime import datetime
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import pandas as pd
+from tqdm import tqdm
+
+from github.GithubException import GithubException
+from github.Repository import Repository
+
+
+MIRRORS_DIR = 'cache/mirrors'
+NOREPLY_EMAIL_PATTERN = r'^(?:[0-9]+\+)?([^@]+)@users\.noreply\.github\.com$'
+
+
+def git(*args: str) -> str:
+    return subprocess.run(['git', *args], check=True, capture_output=True, text=True).stdout
+
+
+def get_mirror_path(repository: Repository) -> str:
+    return f'{MIRRORS_DIR}/{repository.owner.login}/{repository.name}.git'
+
+
+def update_mirror(repository: Repository, url: Optional[str]=None) -> str:
+    """
+    Create a bare clone of the repository, or fetch the new commits if it already exists.
+    """
+    path = get_mirror_path(repository)
+    if pathlib.Path(path).is_dir():
+        git('-C', path, 'fetch', '--quiet', '--prune', 'origin', '+refs/heads/*:refs/heads/*')
+    else:
+        pathlib.Path(path).parents[0].mkdir(parents=True, exist_ok=True)
+        git('clone', '--quiet', '--bare', url or repository.clone_url, path)
+    return path
+
+
+def read_log(path: str, until: Optional[datetime]=None) -> List[dict]:
+    """
+    Read the commits of the default branch, newest first, along with the files changed by each commit.
+
+    For merge commits, the files changed with respect to the first parent are reported (like the GitHub API does).
+    """
+    log_kwargs = [f'--until={until.isoformat()}'] if until is not None else list()
+    log = git('-C', path, 'log', '-z', '-M', '--name-status', '--diff-merges=first-parent', '--format=%x01%H%x1f%aI%x1f%ae', *log_kwargs, 'HEAD')
+    commits = list()
+    for chunk in log.split('\x01')[1:]:
+        header, _, changes = chunk.partition('\x00')
+        sha, timestamp, email = header.split('\x1f')
+        tokens = [token.strip('\n') for token in changes.split('\x00')]
+        tokens = [token for token in tokens if len(token) > 0]
+
+        # Each change is the status followed by the path (or by two paths, for renames and copies)
+        filenames = list()
+        while len(tokens) > 0:
+            status = tokens.pop(0)
+            if status[0] in ('R', 'C'):
+                tokens.pop(0)
+            filenames.append(tokens.pop(0))
+
+        commits.append(dict(
+            sha = sha,
+            timestamp = pd.to_datetime(timestamp, utc=True),
+            email = email,
+            filenames = filenames,
+        ))
+    return commits
+
+
+class BlobReader:
+    """
+    Reads files at given commits from a local repository, using a single `git cat-file --batch` process.
+    """
+
+    def __init__(self, path: str):
+        self.process = subprocess.Popen(['git', '-C', path, 'cat-file', '--batch'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def read(self, sha: str, filepath: str) -> Optional[Tuple[str, bytes]]:
+        """
+        Get the blob SHA and the contents of a file, or `None` if it does not exist at the commit.
+        """
+        self.process.stdin.write(f'{sha}:{filepath}\n'.encode('utf-8'))
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().decode('utf-8').split()
+        if header[-1] in ('missing', 'ambiguous'):
+            return None
+        blob_sha, blob_type, size = header
+        content = self.process.stdout.read(int(size))
+        self.process.stdout.read(1)  ## Skip the trailing newline
+        return (blob_sha, content) if blob_type == 'blob' else None
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def get_updated_tools(reader: BlobReader, sha: str, filenames: List[str], shed_files: ShedFileCache) -> List[dict]:
+    """
+    Get list of the tools for which tools have been added, updated, or removed (like `fetch.get_updated_tools`).
+
+    The `reader` can be any object which provides the `read` method of `BlobReader`.
+    """
+    updated_tools: List[dict] = list()
+    read_shed_files: Set[str] = set()
+
+    for filename in filenames:
+        for directory in pathlib.Path(filename).parents[:-1]:
+            blob = reader.read(sha, str(directory / SHED_FILENAME))
+            if blob is None: continue
+            shed_sha, shed_file = blob
+            if shed_sha not in shed_files:
+                shed_files.misses += 1
+                shed_files.put(shed_sha, parse_shed_categories(shed_file.decode('utf-8')))
+            else:
+                shed_files.hits += 1
+
+            # Make sure each tool (shed file) is processed only once
+            if shed_sha in read_shed_files: continue
+            read_shed_files.add(shed_sha)
+
+            # Record the tool if reading the categories was successful, i.e. the shed file is valid
+            categories = shed_files.get(shed_sha)
+            if categories is not None:
+                updated_tools.append(dict(name = directory.name, categories = categories))
+
+            # We are done with this file, since a shed file was found
+            break
+
+    return list(sorted(updated_tools, key=lambda tool: tool['name']))
+
+
+def get_logins_filepath() -> str:
+    return f'{MIRRORS_DIR}/logins.csv'
+
+
+def get_noreply_login(email: str) -> Optional[str]:
+    """
+    Get the login from a GitHub noreply address (in its original case), or `None` for other emails.
+    """
+    match = re.match(NOREPLY_EMAIL_PATTERN, email, re.IGNORECASE)
+    return match.group(1) if match is not None else None
+
+
+class LoginMapping:
+    """
+    Maps commit author emails to GitHub logins.
+
+    Logins are learned from the cached commit history, from GitHub noreply addresses, and (as a last resort) by asking the GitHub API for a single commit per unknown email.
+    An empty login means that the email is not associated with any GitHub user.
+    The emails are looked up case-insensitively (the logins keep their case).
+    """
+
+    lock = threading.Lock()
+
+    def __init__(self):
+        self.logins: Dict[str, str] = dict()
+        with self.lock:
+            if pathlib.Path(get_logins_filepath()).is_file():
+                df = pd.read_csv(get_logins_filepath(), dtype=str, keep_default_na=False)
+                self.logins.update(zip(df['email'].tolist(), df['login'].tolist()))
+
+        # Logins of noreply addresses are extracted again (previous versions stored them lower-cased)
+        self.logins = {email: login for email, login in self.logins.items() if get_noreply_login(email) is None}
+
+    def learn(self, commits: List[dict], cached_df: pd.DataFrame):
+        """
+        Learn the logins of the emails of previously cached commits.
+        """
+        cached_authors = dict(zip(zip(cached_df['sha'].tolist(), cached_df['timestamp'].tolist()), cached_df['author'].fillna('').tolist()))
+        candidates: Dict[str, collections.Counter] = collections.defaultdict(collections.Counter)
+        for commit in commits:
+            author = cached_authors.get((commit['sha'][:7], str(commit['timestamp'])))
+            if author is not None and commit['email'].lower() not in self.logins:
+                candidates[commit['email'].lower()][author] += 1
+        for email, counter in candidates.items():
+            self.logins[email] = counter.most_common(1)[0][0]
+
+    def resolve(self, repository: Repository, email: str, sha: str) -> str:
+        key = email.lower()
+        if key not in self.logins:
+            login = get_noreply_login(email)  ## From the original email, to keep the case of the login
+            if login is not None:
+                self.logins[key] = login
+            else:
+                try:
+                    self.logins[key] = get_commit_author(repository.get_commit(sha)) or ''
+                except GithubException:
+                    self.logins[key] = ''
+        return self.logins[key]
+
+    def save(self):
+        with self.lock:
+
+            # Merge with the logins learned by other workers in the meantime
+            logins = dict(self.logins)
+            if pathlib.Path(get_logins_filepath()).is_file():
+                df = pd.read_csv(get_logins_filepath(), dtype=str, keep_default_na=False)
+                logins = dict(zip(df['email'].tolist(), df['login'].tolist())) | logins
+
+            # Logins of noreply addresses are not stored, since they are extracted from the emails
+            logins = {email: login for email, login in logins.items() if get_noreply_login(email) is None}
+
+            pathlib.Path(get_logins_filepath()).parents[0].mkdir(parents=True, exist_ok=True)
+            emails = list(sorted(logins.keys()))
+            df = pd.DataFrame(dict(email = emails, login = [logins[email] for email in emails]))
+            df.to_csv(get_logins_filepath(), index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+
+def get_commit_history(repository: Repository, rinfo: RepositoryInfo, until: Optional[datetime]=None, shed_files: Optional[ShedFileCache]=None, position: int=0, desc: Optional[str]=None) -> pd.DataFrame:
+    """
+    Extract the new commits of a repository from a local mirror and update the cache (like `fetch.get_commit_history`).
+    """
+    if shed_files is None: shed_files = ShedFileCache()
+    cached_df = cache.get_cached_commit_history(repository)
+    new_entries = {c: list() for c in cached_df.columns}
+
+    path = update_mirror(repository)
+    commits = read_log(path, until)
+
+    logins = LoginMapping()
+    logins.learn(commits, cached_df)
+
+    # Determine the new commits
+    previous_commits = frozenset(zip(cached_df['sha'].tolist(), cached_df['timestamp'].tolist()))
+    commits = [commit for commit in commits if (commit['sha'][:7], str(commit['timestamp'])) not in previous_commits]
+
+    reader = BlobReader(path) if rinfo.scan_tools else None
+    try:
+        leave = (position == 0)
+        for commit in tqdm(commits, desc=desc, position=position, leave=leave):
+            author = logins.resolve(repository, commit['email'], commit['sha'])
+            if len(author) == 0:
+
+                new_entries['author'].append('')
+                new_entries['tools'].append('')
+
+            else:
+
+                # If enabled, get list of updated tools
+                if rinfo.scan_tools:
+                    updated_tools = get_updated_tools(reader, commit['sha'], commit['filenames'], shed_files)
+                else:
+                    updated_tools = list()
+
+                new_entries['author'].append(author)
+                new_entries['tools'].append(json.dumps(updated_tools))
+
+            new_entries['timestamp'].append(str(commit['timestamp']))
+            new_entries['sha'].append(commit['sha'][:7])
+
+    finally:
+        if reader is not None:
+            reader.close()
+        logins.save()
+
+    if rinfo.scan_tools:
+        shed_files.save()
+
+    history_df = update_commit_history(repository, cached_df, new_entries)
+    if until is None:
+        update_manifest_entry(repository, head_sha = git('-C', path, 'rev-parse', 'HEAD').strip(), pushed_at = str(repository.pushed_at))
+    return history_df
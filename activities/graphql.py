@@ -0,0 +1,270 @@
+from . import cache
+from .fetch import (
+    SHED_FILENAME,
+    CommitCheckpointer,
+    RateLimitBudget,
+    RepositoryInfo,
+    ShedFileCache,
+    get_manifest_entry,
+    update_commit_history,
+    update_manifest_entry,
+)
+from .gitmirror import get_updated_tools
+
+import itertools
+import json
+import pathlib
+import time
+from datetime import (
+    datetime,
+    timezone,
+)
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+import pandas as pd
+from tqdm import tqdm
+
+from github import Github
+from github.GithubException import GithubException
+from github.Repository import Repository
+
+
+HISTORY_QUERY = """
+query($owner: String!, $name: String!, $first: Int!, $after: String, $since: GitTimestamp, $until: GitTimestamp) {
+  repository(owner: $owner, name: $name) {
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          history(first: $first, after: $after, since: $since, until: $until) {
+            totalCount
+            pageInfo { hasNextPage endCursor }
+            nodes {
+              oid
+              authoredDate
+              author { user { login } }
+            }
+          }
+        }
+      }
+    }
+  }
+  rateLimit { cost remaining resetAt }
+}
+"""
+
+
+class GraphQLClient:
+    """
+    Runs GraphQL queries, adapting the size of the queries to their cost.
+
+    The page size is halved when a query fails (GitHub aborts queries which take too long), and grows back after successful queries.
+    When the remaining GraphQL rate limit does not suffice for the next query, the client waits until the rate limit is reset.
+    """
+
+    def __init__(self, g: Github, max_page_size: int=100, min_page_size: int=10):
+        self.g = g
+        self.max_page_size = max_page_size
+        self.min_page_size = min_page_size
+        self.page_size = max_page_size
+        self.requests: int = 0
+        self.cost: int = 0
+
+    def query(self, query: str, variables: dict, status: Optional[tqdm]=None) -> dict:
+        while True:
+            try:
+                _, data = self.g.requester.graphql_query(query, variables)
+                break
+            except GithubException as error:
+                if error.status not in (502, 503, 504) or self.page_size <= self.min_page_size: raise
+                self.page_size = max(self.min_page_size, self.page_size // 2)
+                if 'first' in variables: variables = dict(variables, first=self.page_size)
+        self.page_size = min(self.max_page_size, 2 * self.page_size)
+        self.requests += 1
+
+        # Wait until the rate limit is reset, if it does not suffice for another query of the same cost
+        rate_limit = data['data'].get('rateLimit')
+        if rate_limit is not None:
+            self.cost += rate_limit['cost']
+            if rate_limit['remaining'] < 2 * rate_limit['cost']:
+                resettime = pd.to_datetime(rate_limit['resetAt'], utc=True)
+                if status is not None: status.set_description_str(f'GraphQL rate limit exhausted, waiting until {resettime.strftime("%H:%M:%S")} UTC')
+                time.sleep(max(0, (resettime - datetime.now(timezone.utc)).total_seconds() + 1))
+
+        return data['data']
+
+
+def get_history_pages(client: GraphQLClient, owner: str, name: str, since: Optional[datetime]=None, until: Optional[datetime]=None, status: Optional[tqdm]=None) -> Iterator[dict]:
+    """
+    Yield the pages of the commit history of the default branch (newest first).
+    """
+    cursor = None
+    while True:
+        variables = dict(
+            owner = owner,
+            name = name,
+            first = client.page_size,
+            after = cursor,
+            since = since.isoformat() if since is not None else None,
+            until = until.isoformat() if until is not None else None,
+        )
+        data = client.query(HISTORY_QUERY, variables, status)
+        history = data['repository']['defaultBranchRef']['target']['history']
+        yield history
+        if not history['pageInfo']['hasNextPage']: break
+        cursor = history['pageInfo']['endCursor']
+
+
+class BlobLookup:
+    """
+    Looks up files at given commits using batched GraphQL queries (mimics `gitmirror.BlobReader`).
+
+    All lookups must be registered using `prefetch` before they are read.
+    """
+
+    def __init__(self, client: GraphQLClient, owner: str, name: str, max_aliases: int=50):
+        self.client = client
+        self.owner = owner
+        self.name = name
+        self.max_aliases = max_aliases
+        self.blobs: Dict[str, Optional[Tuple[str, bytes]]] = dict()
+
+    def prefetch(self, expressions: List[str], status: Optional[tqdm]=None):
+        expressions = list(dict.fromkeys(expression for expression in expressions if expression not in self.blobs))
+        for batch_start in range(0, len(expressions), self.max_aliases):
+            batch = expressions[batch_start : batch_start + self.max_aliases]
+            if status is not None: status.set_description_str(f'Peeking {len(batch)} shed files')
+            query_parts = [
+                f'f{eidx}: object(expression: {json.dumps(expression)}) {{ ... on Blob {{ oid text }} }}'
+                for eidx, expression in enumerate(batch)
+            ]
+            query = f'query {{ repository(owner: {json.dumps(self.owner)}, name: {json.dumps(self.name)}) {{ {" ".join(query_parts)} }} rateLimit {{ cost remaining resetAt }} }}'
+            data = self.client.query(query, dict(), status)
+            for eidx, expression in enumerate(batch):
+                blob = data['repository'].get(f'f{eidx}')
+                if blob is None or blob.get('oid') is None or blob.get('text') is None:
+                    self.blobs[expression] = None
+                else:
+                    self.blobs[expression] = (blob['oid'], blob['text'].encode('utf-8'))
+
+    def read(self, sha: str, filepath: str) -> Optional[Tuple[str, bytes]]:
+        return self.blobs[f'{sha}:{filepath}']
+
+
+def get_shed_expressions(sha: str, filenames: List[str]) -> List[str]:
+    """
+    Get the expressions for all shed files, which might be affected by the changes of the given files.
+    """
+    expressions = list()
+    for filename in filenames:
+        for directory in pathlib.Path(filename).parents[:-1]:
+            expressions.append(f'{sha}:{directory / SHED_FILENAME}')
+    return expressions
+
+
+def get_commit_history(g: Github, repository: Repository, rinfo: RepositoryInfo, until: Optional[datetime]=None, shed_files: Optional[ShedFileCache]=None, budget: Optional[RateLimitBudget]=None, position: int=0, desc: Optional[str]=None, full: bool=False) -> pd.DataFrame:
+    """
+    Fetch the new commits of a repository using the GraphQL API and update the cache (like `fetch.get_commit_history`).
+
+    Author logins, dates, and SHAs are fetched for up to 100 commits per query, and shed files are looked up in batches.
+    The GraphQL API does not report the files changed by a commit, so these are still fetched using the REST API (only for commits with an author, if tools are scanned).
+    """
+    if shed_files is None: shed_files = ShedFileCache()
+    client = GraphQLClient(g)
+    owner, name = repository.owner.login, repository.name
+
+    cached_df = cache.get_cached_commit_history(repository)
+    new_entries = {c: list() for c in cached_df.columns}
+
+    # Resume from the checkpoints of a previously interrupted walk (if any)
+    resumed_df = cache.get_checkpoint_segments(repository)
+    checkpointer = CommitCheckpointer(repository)
+    known_commits = frozenset(zip(cached_df['sha'].tolist(), cached_df['timestamp'].tolist()))
+    known_commits |= frozenset(zip(resumed_df['sha'].tolist(), resumed_df['timestamp'].tolist()))
+
+    # Walk only the commits since the watermark, if the HEAD from the last run is known (see `fetch.process_new_commits`)
+    previous_head_sha = None if full else get_manifest_entry(repository).get('head_sha')
+    incremental = previous_head_sha is not None and until is None and len(cached_df) > 0
+    since = pd.to_datetime(cached_df['timestamp'], utc=True).max().to_pydatetime() if incremental else None
+    head_sha = None
+
+    blobs = BlobLookup(client, owner, name)
+    leave = (position == 0)
+    pbar = tqdm(desc=desc, position=position, leave=leave)
+    status = tqdm(total=0, bar_format='{desc}', position=position + 1, leave=leave)
+    try:
+        for page in get_history_pages(client, owner, name, since, until, status):
+            if pbar.total is None and not incremental:
+                pbar.total = page['totalCount'] - len(known_commits)
+                pbar.refresh()
+
+            # Determine the new commits of this page
+            new_commits = list()
+            reached_head = False
+            for node in page['nodes']:
+                if head_sha is None and until is None: head_sha = node['oid']
+                if incremental and node['oid'] == previous_head_sha:
+                    reached_head = True
+                    break
+                timestamp = pd.to_datetime(node['authoredDate'], utc=True)
+                if (node['oid'][:7], str(timestamp)) in known_commits: continue
+                author = (node['author'] or dict()).get('user') or dict()
+                new_commits.append(dict(sha = node['oid'], timestamp = timestamp, author = author.get('login'), filenames = None))
+
+            # Get the changed files (REST) and look up the affected shed files (batched GraphQL)
+            if rinfo.scan_tools:
+                for commit in new_commits:
+                    if commit['author'] is None: continue
+                    if budget is not None: budget.throttle(status)
+                    status.set_description_str(f'Fetching files of {commit["sha"][:7]}')
+                    commit['filenames'] = [file.filename for file in repository.get_commit(commit['sha']).files]
+                blobs.prefetch(list(itertools.chain.from_iterable(get_shed_expressions(commit['sha'], commit['filenames']) for commit in new_commits if commit['filenames'] is not None)), status)
+
+            for commit in new_commits:
+                if commit['author'] is None:
+
+                    new_entries['author'].append('')
+                    new_entries['tools'].append('')
+
+                else:
+
+                    if rinfo.scan_tools:
+                        updated_tools = get_updated_tools(blobs, commit['sha'], commit['filenames'], shed_files)
+                    else:
+                        updated_tools = list()
+
+                    new_entries['author'].append(commit['author'])
+                    new_entries['tools'].append(json.dumps(updated_tools))
+
+                new_entries['timestamp'].append(str(commit['timestamp']))
+                new_entries['sha'].append(commit['sha'][:7])
+                pbar.update(1)
+
+            checkpointer.update(new_entries)
+            if len(page['nodes']) > 0:
+                status.set_description_str(f'Current position: {pd.to_datetime(page["nodes"][-1]["authoredDate"], utc=True).strftime("%Y/%m/%d")}')
+            if reached_head: break
+            if pbar.total is not None and pbar.n >= pbar.total: break
+
+    finally:
+        pbar.close()
+        status.close()
+
+    tqdm.write(f'{repository.full_name}: {client.requests} GraphQL queries (cost: {client.cost})')
+    if rinfo.scan_tools:
+        shed_files.save()
+
+    # The checkpointed commits are merged with the cache, and are then no longer needed
+    if len(resumed_df) > 0:
+        cached_df = pd.concat([cached_df, resumed_df]) if len(cached_df) > 0 else resumed_df
+        cached_df = cached_df.drop_duplicates(['timestamp', 'sha'])
+    history_df = update_commit_history(repository, cached_df, new_entries)
+    cache.clear_checkpoint_segments(repository)
+    if head_sha is not None:
+        update_manifest_entry(repository, head_sha = head_sha, pushed_at = str(repository.pushed_at))
+    return history_df
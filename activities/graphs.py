@@ -1,5 +1,13 @@
-import warnings
+from . import cache
+
+import functools
+import glob
+import hashlib
+import io
 import os, os.path
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import (
     datetime,
     timedelta,
@@ -7,87 +15,315 @@ from datetime import (
 
 import numpy as np
 import pandas as pd
-import skimage, skimage.io, skimage.transform
-import scipy.ndimage as ndi
+import requests
+import requests.adapters
 from PIL import Image, ImageDraw
+from tqdm import tqdm
+from urllib3.util import Retry
 
 
 node_label_prefix = '\n\n\n\n\n'
 node_kwargs = dict(shape='box')
 
 
-def load_image_url(url):
+AVATAR_SIZE = 128
+
+
+def decode_image(content, size=AVATAR_SIZE):
+    """
+    Decode an image and downsize it to `size`×`size` pixels (RGBA, uint8).
+    """
+    img = Image.open(io.BytesIO(content))
+    img.draft('RGB', (2 * size, 2 * size))  ## JPEG images are downsized while decoding
+    img = img.convert('RGBA')
+    return np.asarray(img.resize((size, size), Image.LANCZOS, reducing_gap=2.0))
+
+
+def load_image_url(url, session=None, size=AVATAR_SIZE):
     try:
-        img = skimage.io.imread(url, plugin='matplotlib')
+        response = (session or requests).get(url, timeout=30)
+        response.raise_for_status()
+        return decode_image(response.content, size)
     except:
         print(f'\nFailed to load image from URL: "{url}"\n')
         raise
-    return skimage.img_as_float(img)
 
 
-def image_to_disk(img):
-    mask = np.ones(img.shape[:2], bool)
-    mask[mask.shape[0] // 2, mask.shape[1] // 2] = False
-    mask = ndi.distance_transform_edt(mask) < min(mask.shape) // 2 - 2
-    return np.concatenate([img[:, :, :3], mask[:, :, None]], axis=2)
+@functools.lru_cache
+def get_avatar_mask(transform, size=AVATAR_SIZE, supersampling=4):
+    """
+    Get the alpha channel of the avatars of a transform (a disk, or a square with rounded corners), anti-aliased by supersampling.
+    """
+    mask = Image.new('L', (size * supersampling, size * supersampling), 0)
+    draw = ImageDraw.Draw(mask)
+    if transform == 'disk':
+        margin = supersampling // 2  ## Half a pixel (previous versions left 2 pixels at the full resolution of the avatars)
+        draw.ellipse((margin, margin, mask.size[0] - margin, mask.size[1] - margin), fill=255)
+    else:
+        draw.rounded_rectangle((0, 0, *mask.size), fill=255, width=0, radius=round(mask.size[0] * 0.2))
+    mask = np.asarray(mask.resize((size, size), Image.LANCZOS))
+    mask.flags.writeable = False  ## The mask is shared by all callers
+    return mask
 
 
-def image_to_rounded_square(img):
-    assert img.shape[2] in (3, 4), img.shape
-    
-    # Create mask of appropriate size (square with rounded corners)
-    size = max(img.shape[:2])
-    mask = Image.new('RGB', (size, size), 'black')
-    draw = ImageDraw.Draw(mask)
-    draw.rounded_rectangle((0, 0, size, size), fill='white', width=0, radius=round(size * 0.2))
-    mask = np.asarray(mask)[:, :, 0].copy()
-    
-    # Convert RGBA image to RGB with white background
-    if img.shape[2] == 4:
-        img_RGB = img[:, :, :3]
-        img_A = img[:, :, 3][:, :, None]
-        img = (1 + (img_RGB - 1) * img_A)
-    
-    # Convert to RGBA using the alpha channel from the mask
-    result = np.concatenate([img, mask[:, :, None]], axis=2)
-    return result.clip(0, 1)
+def images_to_disks(imgs):
+    """
+    Replace the alpha channel of a batch of RGBA images (shape N×size×size×4, uint8) by a disk.
+    """
+    result = imgs.copy()
+    result[:, :, :, 3] = get_avatar_mask('disk', imgs.shape[1])
+    return result
+
+
+def images_to_rounded_squares(imgs):
+    """
+    Put a batch of RGBA images (shape N×size×size×4, uint8) on white background, and replace the alpha channel by a square with rounded corners.
+    """
+    alpha = imgs[:, :, :, 3:].astype(np.uint16)
+    result = np.empty_like(imgs)
+    result[:, :, :, :3] = (imgs[:, :, :, :3] * alpha + 255 * (255 - alpha) + 127) // 255
+    result[:, :, :, 3] = get_avatar_mask('rounded_square', imgs.shape[1])
+    return result
+
+
+AVATAR_TRANSFORMS = dict(
+    disk = images_to_disks,
+    rounded_square = images_to_rounded_squares,
+)
+
+
+def get_avatar_transform(name):
+    """
+    Get the transform of the avatar of an author (disk) or a repository (rounded square).
+    """
+    return 'rounded_square' if '/' in name else 'disk'
 
 
 class AvatarCache:
+    """
+    Avatar images of authors and repositories, created from the cached avatar URLs (see `cache.get_cached_avatars`).
+
+    The images are stored by the hash of their source URL and transform (see `get_avatar_transform`), so that the repositories of an owner share a single image, and an image is only created again if its URL changes.
+    The avatar URLs are loaded only once. Missing images are downloaded concurrently by a bounded pool of threads, which share a session (connections are reused, and failed requests are retried). Each URL is downloaded only once.
+    The images are downsized right away, and the transforms are then applied to whole batches of images (see `AVATAR_TRANSFORMS`).
+    Use `get_avatar_cache` to get the instance shared by the whole process.
+    """
 
-    def __init__(self, cache_dir='cache/avatars'):
+    def __init__(self, cache_dir='cache/avatars', max_workers=8, retries=3, batch_size=64):
         self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.retries = retries
+        self.avatar_urls = None
+        self.session = None
+        self.available = set()  ## Keys of the images known to be on disk
+        self.hits = 0
+        self.misses = 0
+        self.downloads = 0
+
+    def get_avatar_urls(self):
+        if self.avatar_urls is None:
+            df_avatars = cache.get_cached_avatars()
+            self.avatar_urls = dict(zip(df_avatars['name'].tolist(), df_avatars['avatar_url'].tolist()))
+        return self.avatar_urls
+
+    def get_avatar_url(self, name):
+        return self.get_avatar_urls()[name.lower()]
+
+    def get_key(self, name):
+        """
+        Get the key of the image of an avatar (authors and repositories without an avatar get the blank image).
+        """
+        url = '' if name == '.blank' else self.get_avatar_url(name)
+        if len(url) == 0:
+            return '.blank'
+        else:
+            return hashlib.sha256(f'{get_avatar_transform(name)} {url}'.encode('utf-8')).hexdigest()
 
     def get_filename(self, name):
-        return f'{self.cache_dir}/{name}.png'
+        return f'{self.cache_dir}/{self.get_key(name)}.png'
+
+    def get_session(self):
+        if self.session is None:
+            retry = Retry(total=self.retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+            adapter = requests.adapters.HTTPAdapter(max_retries=retry, pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+            self.session = requests.Session()
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+        return self.session
+
+    def save(self, key, avatar):
+
+        # Write to a temporary file first, so that concurrent workers never read a partially written image
+        filename = f'{self.cache_dir}/{key}.png'
+        tmp_filename = f'{self.cache_dir}/{key}.{os.getpid()}-{threading.get_ident()}.tmp.png'
+        Image.fromarray(avatar, 'RGBA').save(tmp_filename, compress_level=1)  ## Fast compression, the images are small anyway
+        os.replace(tmp_filename, filename)
+
+    def create(self, batch, executor=None):
+        """
+        Create the avatars of a batch of downsized images (tuples of the key of the avatar, the image, and the transform).
+        """
+        for transform, batch_transform in AVATAR_TRANSFORMS.items():
+            items = [(key, img) for key, img, item_transform in batch if item_transform == transform]
+            if len(items) == 0: continue
+            avatars = batch_transform(np.stack([img for _, img in items]))
+            list((executor.map if executor is not None else map)(self.save, [key for key, _ in items], avatars))
+
+    def load(self, authors, repositories, desc=None):
+        """
+        Make sure that the avatars of the given authors and repositories (and the blank avatar) are on disk.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Check which images need to be created (grouped by their URL, so that each URL is downloaded only once)
+        missing = dict()
+        for name in ['.blank', *authors, *repositories]:
+            key = self.get_key(name)
+            if key in self.available: continue
+            if os.path.isfile(f'{self.cache_dir}/{key}.png'):
+                self.hits += 1
+                self.available.add(key)
+            else:
+                url = None if key == '.blank' else self.get_avatar_url(name)
+                missing.setdefault(url, dict())[key] = 'disk' if key == '.blank' else get_avatar_transform(name)
+        if len(missing) == 0: return
 
-    def load(self, authors, repositories):
-        df_avatars = pd.read_csv('report/_data/avatars.csv')
-        df_avatars.set_index('name', inplace=True)
+        def download(url):
+            if url is None:
+                return np.full((AVATAR_SIZE, AVATAR_SIZE, 4), 255, np.uint8)
+            else:
+                return load_image_url(url, self.get_session())
+
+        # Download the missing images (already downsized) and create the avatars, one batch of URLs at a time
+        urls = list(missing.keys())
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor, tqdm(total=len(urls), desc=desc, disable=desc is None) as pbar:
+            for batch_start in range(0, len(urls), self.batch_size):
+                batch_urls = urls[batch_start : batch_start + self.batch_size]
+                imgs = list(executor.map(download, batch_urls))
+                self.create([(key, img, transform) for url, img in zip(batch_urls, imgs) for key, transform in missing[url].items()], executor)
+                pbar.update(len(batch_urls))
+
+        for url, transforms in missing.items():
+            self.downloads += int(url is not None)
+            self.misses += len(transforms)
+            self.available |= frozenset(transforms.keys())
+
+    def prune(self):
+        """
+        Remove the images which no longer correspond to any of the avatar URLs (e.g., because an URL has changed).
+        """
+        keys = frozenset(self.get_key(name) for name in self.get_avatar_urls().keys()) | frozenset(['.blank'])
+        for filepath in glob.glob(f'{self.cache_dir}/**/*.png', recursive=True):
+            if os.path.dirname(filepath) != self.cache_dir or os.path.basename(filepath)[:-len('.png')] not in keys:
+                os.remove(filepath)
+
+        # Remove the directories of the owners (used by previous versions)
+        for directory in glob.glob(f'{self.cache_dir}/*/'):
+            if len(os.listdir(directory)) == 0:
+                os.rmdir(directory)
+
+    def get_stats(self):
+        hit_rate = self.hits / max(self.hits + self.misses, 1)
+        return f'Avatar cache: {self.hits} hits, {self.misses} created from {self.downloads} downloads ({100 * hit_rate:.1f}% hit rate)'
+
+
+avatar_cache = None
+
+
+def get_avatar_cache():
+    """
+    Get the avatar cache shared by the whole process.
+    """
+    global avatar_cache
+    if avatar_cache is None:
+        avatar_cache = AvatarCache()
+    return avatar_cache
+
+
+class LayoutCache:
+    """
+    Rendered graphs, stored by the hash of the graph (the DOT source with all nodes, edges, and attributes), the layout program, the format, and the label.
+
+    The order of the nodes and edges is part of the hash, since it also determines the layout. The images referenced by the nodes (e.g., avatars) are included by their size and modification time, so that a graph is rendered again if one of its images changes.
+    The least recently used images are evicted when the cache exceeds `max_size` bytes (see `prune`).
+    Use `get_layout_cache` to get the instance shared by the whole process.
+    """
+
+    def __init__(self, cache_dir='cache/layouts', max_size=512 * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, A, prog, fmt, label=None):
+        images = list()
+        for node in A.nodes():
+            image = node.attr.get('image')
+            if image:
+                stat = os.stat(image) if os.path.isfile(image) else None
+                images.append(f'{image}:{stat.st_size}:{stat.st_mtime_ns}' if stat is not None else image)
+        data = '\n'.join([prog, fmt, str(label), A.string(), *images])
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def draw(self, A, filepath, prog, label=None):
+        """
+        Do the layout of a graph with `prog`, set the `label` of the graph (after the layout), and draw the graph to `filepath`.
+
+        Both, the layout and the drawing, are skipped if the graph was already rendered before.
+        """
+        fmt = filepath.split('.')[-1].lower()
+        key = self.get_key(A, prog, fmt, label)
+        cached_filepath = f'{self.cache_dir}/{key}.{fmt}'
+        if os.path.isfile(cached_filepath):
+            self.hits += 1
+            shutil.copyfile(cached_filepath, filepath)
+            os.utime(cached_filepath)  ## Mark as recently used
+            return
+
+        # Render the graph
+        self.misses += 1
+        A.layout(prog=prog)
+        if label is not None:
+            A.graph_attr.update(label=label)
+        A.draw(path=filepath, format=fmt)
+
+        # Write to a temporary file first, so that concurrent workers never read a partially written image
         os.makedirs(self.cache_dir, exist_ok=True)
-    
-        # Check which avatars need to be created
-        is_cached = lambda name: os.path.isfile(self.get_filename(name))
-    
-        # Create avatar images
-        avatars = {'.blank': image_to_disk(np.ones((128, 128, 4), float))}
-        for username in authors:
-            if is_cached(username): continue
-            avatars[username] = image_to_disk(load_image_url(df_avatars.loc[username.lower()].avatar_url))
-        for reponame in repositories:
-            if is_cached(reponame): continue
-            avatars[reponame] = image_to_rounded_square(load_image_url(df_avatars.loc[reponame.lower()].avatar_url))
-    
-        # Write created images to cache
-        for name, avatar in avatars.items():
-            name_parts = name.split('/')
-            if len(name_parts) > 1:
-                owner = name_parts[0]
-                os.makedirs(f'{self.cache_dir}/{owner}', exist_ok=True)
-            avatar = skimage.transform.resize(avatar, (128, 128), anti_aliasing=True)
-            with warnings.catch_warnings():
-                warnings.simplefilter('ignore')
-                skimage.io.imsave(self.get_filename(name), skimage.img_as_ubyte(avatar))
+        tmp_filepath = f'{self.cache_dir}/{key}.{os.getpid()}-{threading.get_ident()}.tmp'
+        shutil.copyfile(filepath, tmp_filepath)
+        os.replace(tmp_filepath, cached_filepath)
+
+    def prune(self):
+        """
+        Remove the least recently used images, until the cache does not exceed `max_size` bytes.
+        """
+        entries = list()
+        for filepath in glob.glob(f'{self.cache_dir}/*'):
+            stat = os.stat(filepath)
+            entries.append((stat.st_mtime, stat.st_size, filepath))
+        size = 0
+        for _, filesize, filepath in sorted(entries, reverse=True):
+            size += filesize
+            if size > self.max_size or filepath.endswith('.tmp'):
+                os.remove(filepath)
+
+    def get_stats(self):
+        hit_rate = self.hits / max(self.hits + self.misses, 1)
+        return f'Layout cache: {self.hits} hits, {self.misses} misses ({100 * hit_rate:.1f}% hit rate)'
+
+
+layout_cache = None
+
+
+def get_layout_cache():
+    """
+    Get the layout cache shared by the whole process.
+    """
+    global layout_cache
+    if layout_cache is None:
+        layout_cache = LayoutCache()
+    return layout_cache
 
 
 def filter_by_timestamp(df, first_day=None, last_day=None):
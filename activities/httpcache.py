@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import pathlib
+import re
+import threading
+from typing import (
+    Any,
+    Dict,
+    Optional,
+)
+
+import requests
+import requests.adapters
+import requests.structures
+
+from github.Requester import (
+    HTTPRequestsConnectionClass,
+    Requester,
+    RequestsResponse,
+)
+
+
+# Resources which never change once they exist (addressed by full SHAs)
+IMMUTABLE_URL_PATTERNS = [
+    r'/git/trees/[0-9a-f]{40}(\?|$)',
+    r'/git/blobs/[0-9a-f]{40}(\?|$)',
+    r'/commits/[0-9a-f]{40}(\?|$)',
+    r'/contents/.*[?&]ref=[0-9a-f]{40}(&|$)',
+]
+
+# Response headers which must not be replayed from the cache
+VOLATILE_HEADERS = frozenset([
+    'content-encoding',
+    'content-length',
+    'transfer-encoding',
+    'date',
+    'x-github-request-id',
+    'x-ratelimit-limit',
+    'x-ratelimit-remaining',
+    'x-ratelimit-reset',
+    'x-ratelimit-used',
+    'x-ratelimit-resource',
+])
+
+
+def is_immutable(url: str) -> bool:
+    return any(re.search(pattern, url) is not None for pattern in IMMUTABLE_URL_PATTERNS)
+
+
+class HTTPCache:
+    """
+    Persistent cache of HTTP responses, keyed by URL (and the requested media type).
+
+    Along with each response, its `ETag` and `Last-Modified` headers are stored, so that it can be revalidated using a conditional request.
+    The total size of the cache is bounded, and the least recently used responses are evicted first (the access time is tracked using the modification time of the files).
+    """
+
+    def __init__(self, cache_dir: str='cache/http', max_size: int=2 * 1024 ** 3):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.lock = threading.Lock()  ## Guards the size and the counters (the cache is shared by the connections of all worker threads)
+        self.size = sum(filepath.stat().st_size for filepath in self.cache_dir.glob('*/*.json'))
+        self.hits: int = 0
+        self.revalidations: int = 0
+        self.misses: int = 0
+
+    def get_filepath(self, url: str, accept: str) -> pathlib.Path:
+        key = hashlib.sha256(f'{accept} {url}'.encode('utf-8')).hexdigest()
+        return self.cache_dir / key[:2] / f'{key}.json'
+
+    def load(self, url: str, accept: str) -> Optional[Dict[str, Any]]:
+        filepath = self.get_filepath(url, accept)
+        try:
+            with open(filepath) as fp:
+                entry = json.load(fp)
+            os.utime(filepath)  ## Mark as recently used
+            return entry
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def store(self, url: str, accept: str, headers: Dict[str, str], body: str):
+        filepath = self.get_filepath(url, accept)
+        filepath.parents[0].mkdir(exist_ok=True)
+        data = json.dumps(dict(url = url, headers = headers, body = body))
+        with self.lock:
+            previous_size = filepath.stat().st_size if filepath.is_file() else 0
+            tmp_filepath = filepath.with_suffix(f'.{threading.get_ident()}.tmp')
+            with open(tmp_filepath, 'w') as fp:
+                fp.write(data)
+            os.replace(tmp_filepath, filepath)
+            self.size += filepath.stat().st_size - previous_size
+            if self.size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used responses, until the cache is reduced to 90% of its maximum size.
+        """
+        entries = sorted((filepath.stat().st_mtime, filepath) for filepath in self.cache_dir.glob('*/*.json'))
+        for _, filepath in entries:
+            if self.size <= 0.9 * self.max_size: break
+            self.size -= filepath.stat().st_size
+            filepath.unlink()
+
+    def get_stats(self) -> str:
+        requests_count = self.hits + self.revalidations + self.misses
+        hit_rate = (self.hits + self.revalidations) / max(requests_count, 1)
+        return f'HTTP cache: {self.hits} hits, {self.revalidations} revalidated (304), {self.misses} misses ({100 * hit_rate:.1f}% hit rate)'
+
+
+class CachingHTTPSConnectionClass:
+    """
+    Connection class for PyGithub, which serves GET requests from the shared `HTTPCache` (mimics `github.Requester.HTTPSRequestsConnectionClass`).
+
+    Immutable resources are served straight from the cache. Other cached resources are revalidated using conditional requests, which are not counted against the rate limit if they yield 304.
+    """
+
+    cache: Optional[HTTPCache] = None
+    session: Optional[requests.Session] = None
+    session_lock = threading.Lock()
+
+    def __init__(self, host: str, port: Optional[int]=None, strict: bool=False, timeout: Optional[int]=None, retry: Any=None, pool_size: Optional[int]=None, **kwargs):
+        self.host = host
+        self.port = port if port else 443
+        self.protocol = 'https'
+        self.timeout = timeout
+        self.verify = kwargs.get('verify', True)
+
+        # PyGithub creates a new connection for each request, so the session is created only once and shared
+        with self.session_lock:
+            if CachingHTTPSConnectionClass.session is None:
+                session = requests.Session()
+                session.auth = Requester.noopAuth
+                adapter = requests.adapters.HTTPAdapter(
+                    max_retries=requests.adapters.DEFAULT_RETRIES if retry is None else retry,
+                    pool_connections=requests.adapters.DEFAULT_POOLSIZE if pool_size is None else pool_size,
+                    pool_maxsize=requests.adapters.DEFAULT_POOLSIZE if pool_size is None else pool_size,
+                )
+                session.mount('https://', adapter)
+                CachingHTTPSConnectionClass.session = session
+
+    def request(self, verb: str, url: str, input: Any, headers: Dict[str, str], stream: bool=False):
+        self.verb = verb
+        self.url = url
+        self.input = input
+        self.headers = headers
+        self.stream = stream
+
+    def send(self, headers: Dict[str, str]) -> requests.Response:
+        verb = getattr(self.session, self.verb.lower())
+        url = f'{self.protocol}://{self.host}:{self.port}{self.url}'
+        return verb(url, headers=headers, data=self.input, timeout=self.timeout, verify=self.verify, allow_redirects=False)
+
+    def getresponse(self) -> RequestsResponse:
+        if self.verb != 'GET' or self.stream:
+            return RequestsResponse(self.send(self.headers))
+
+        accept = self.headers.get('Accept', '')
+        entry = self.cache.load(self.url, accept)
+
+        # Serve immutable resources straight from the cache
+        if entry is not None and is_immutable(self.url):
+            with self.cache.lock:
+                self.cache.hits += 1
+            return create_response(200, entry['headers'], entry['body'])
+
+        # Revalidate other cached resources using a conditional request
+        headers = dict(self.headers)
+        if entry is not None:
+            if 'etag' in entry['headers']:
+                headers['If-None-Match'] = entry['headers']['etag']
+            if 'last-modified' in entry['headers']:
+                headers['If-Modified-Since'] = entry['headers']['last-modified']
+        r = self.send(headers)
+
+        # Replay the cached response, but with the up-to-date rate limit headers
+        if r.status_code == 304 and entry is not None:
+            with self.cache.lock:
+                self.cache.revalidations += 1
+            response_headers = dict(entry['headers'])
+            response_headers.update({key.lower(): value for key, value in r.headers.items() if key.lower().startswith('x-ratelimit-')})
+            return create_response(200, response_headers, entry['body'])
+
+        with self.cache.lock:
+            self.cache.misses += 1
+        if r.status_code == 200:
+            response_headers = {key.lower(): value for key, value in r.headers.items()}
+            if is_immutable(self.url) or 'etag' in response_headers or 'last-modified' in response_headers:
+                cached_headers = {key: value for key, value in response_headers.items() if key not in VOLATILE_HEADERS}
+                self.cache.store(self.url, accept, cached_headers, r.text)
+        return RequestsResponse(r)
+
+    def close(self):
+        pass  ## The session is shared by all connections
+
+
+def create_response(status: int, headers: Dict[str, str], body: str) -> RequestsResponse:
+    r = requests.Response()
+    r.status_code = status
+    r.headers = requests.structures.CaseInsensitiveDict(headers)
+    r.encoding = 'utf-8'
+    r._content = body.encode('utf-8')
+    return RequestsResponse(r)
+
+
+def install(cache_dir: str='cache/http', max_size: int=2 * 1024 ** 3) -> HTTPCache:
+    """
+    Make all GitHub instances use the HTTP cache (must be called before the first request is made).
+    """
+    CachingHTTPSConnectionClass.cache = HTTPCache(cache_dir, max_size)
+    Requester.injectConnectionClasses(HTTPRequestsConnectionClass, CachingHTTPSConnectionClass)
+    return CachingHTTPSConnectionClass.cache
@@ -3,11 +3,26 @@ from . import (
     communitygraph,
     contributiongraph,
 )
+from .corpus import (
+    Corpus,
+    get_peak_rss,
+    to_text,
+)
+from .graphs import (
+    filter_by_timestamp,
+    get_avatar_cache,
+    get_layout_cache,
+)
 
 import os
 import csv
+import functools
+import glob
+import hashlib
 import json
+import urllib.error
 import urllib.request
+from concurrent.futures import ProcessPoolExecutor
 from datetime import (
     datetime,
     timedelta,
@@ -22,6 +37,7 @@ from tqdm import tqdm
 
 import matplotlib
 matplotlib.use('Agg')
+matplotlib.rcParams['svg.hashsalt'] = 'galaxy-community-activities'  ## Reproducible SVG files
 import matplotlib.pyplot as plt
 from matplotlib.colors import hsv_to_rgb
 
@@ -36,29 +52,74 @@ def apply_item_filter(item_filter, item):
         return None
 
 
-def expand_list(elist):
-    items = list()
+LIST_TTL = timedelta(days=1)  ## Cached remote lists are revalidated after this time
+expanded_lists = dict()  ## In-memory cache of the expanded lists, by URL and filter
+
+
+def fetch_list(url, offline=False):
+    """
+    Get the lines of a remote list, which are cached on disk (see `cache.get_cached_list`) and revalidated using their ETag once they are older than `LIST_TTL`.
+
+    In offline mode, only the cached lists are used (regardless of their age).
+    """
+    entry = cache.get_cached_list(url)
+    now = datetime.now(timezone.utc)
+    if entry is not None and (offline or now - pd.to_datetime(entry['timestamp']) < LIST_TTL):
+        return entry['lines']
+    if offline:
+        raise ValueError(f'Remote list is not cached (required in offline mode): {url}')
+
+    # Fetch the list, or revalidate the cached list using a conditional request
+    request = urllib.request.Request(url)
+    if entry is not None and entry.get('etag'):
+        request.add_header('If-None-Match', entry['etag'])
+    try:
+        with urllib.request.urlopen(request) as response:
+            lines = [line.decode('utf-8').strip() for line in response]
+            entry = dict(lines = lines, etag = response.headers.get('ETag'))
+    except urllib.error.HTTPError as error:
+        if entry is None or (error.code != 304 and error.code < 500): raise
+
+        # The server is (temporarily) failing, so the cached list is used
+        if error.code != 304:
+            print(f'*** Failed to revalidate: {url} (HTTP {error.code}, using the cached list from {entry["timestamp"]})')
+            return entry['lines']
+    except urllib.error.URLError:
+        if entry is None: raise
+        print(f'*** Failed to revalidate: {url} (using the cached list from {entry["timestamp"]})')
+        return entry['lines']
+
+    cache.set_cached_list(url, dict(entry, timestamp = str(now)))
+    return entry['lines']
+
+
+def expand_list(elist, offline=False):
+    items = set()
     for info in elist:
         if 'expand' in info:
             url = info['expand']
             item_filter = info.get('filter', None)
-            try:
-                for item in urllib.request.urlopen(url):
-                    item = item.decode('utf-8').strip()
-                    if item_filter is not None:
-                        item = apply_item_filter(item_filter, item)
-                        if item is None: continue
-                    items.append(item)
-            except:
-                print(f'*** Failed to expand: {url}')
-                raise
+            key = (url, json.dumps(item_filter, sort_keys=True))
+            if key not in expanded_lists:
+                try:
+                    expanded_items = list()
+                    for item in fetch_list(url, offline):
+                        if item_filter is not None:
+                            item = apply_item_filter(item_filter, item)
+                            if item is None: continue
+                        expanded_items.append(item)
+                except:
+                    print(f'*** Failed to expand: {url}')
+                    raise
+                expanded_lists[key] = frozenset(expanded_items)
+            items |= expanded_lists[key]
         else:
             assert isinstance(info, str), str(info)
-            items.append(info)
-    return items
+            items.add(info)
+    return frozenset(items)
 
 
-def get_community_dataframe(community):
+def get_community_rules(community, offline=False):
 
     # Get list of repositories relevant to the community
     if 'repositories' in community:
@@ -68,75 +129,85 @@ def get_community_dataframe(community):
 
     # Get list of tool categories relevant to the community (if any)
     if 'categories' in community:
-        categories = expand_list(community['categories'])
+        categories = frozenset([c.lower() for c in expand_list(community['categories'], offline)])
     else:
         categories = None
 
     # Get list of tools to keep even if it was ruled out due to the categories
     if 'keep-tools' in community:
-        keep_tools = frozenset(expand_list(community['keep-tools']))
+        keep_tools = expand_list(community['keep-tools'], offline)
     else:
         keep_tools = frozenset()
 
     # Get list of tools to exclude even if categories match
     if 'exclude-tools' in community:
-        exclude_tools = frozenset(expand_list(community['exclude-tools']))
+        exclude_tools = expand_list(community['exclude-tools'], offline)
     else:
         exclude_tools = frozenset()
 
-    # Read the repositories and keep only the rows with matching categories
-    df_list = list()
-    for repo in repositories:
-        df = pd.read_csv(cache.get_cached_repository_filepath(repo))
-        if categories is not None or len(keep_tools) > 0:
-            df.tools = df.tools.fillna('[]')
-
-            # List of commits (row indices) to drop from the current dataframe
-            drop_idx_list = list()
-
-            for row_idx, row in enumerate(df.tools):
-                row_tools = json.loads(row)
-
-                # Names of tools from this community, affected by the current commit
-                community_tools = set()
-
-                # Iterate all tools affected by the current commit…
-                for tool in row_tools:
-                    keep = True
-
-                    # …and filter by categories:
-                    if categories is not None:
-                        tool_categories = frozenset([c.lower().strip() for c in tool['categories']])
-                        if not any([c.lower() in tool_categories for c in categories]):
-                            keep = False
-
-                    # …but also apply the rules from tool lists:
-                    if tool['name'] in keep_tools:
-                        keep = True
-
-                    if tool['name'] in exclude_tools:
-                        keep = False
-
-                    if keep:
-                        community_tools.add(tool['name'])
-
-                # Drop this commit if it didn't concern any tools from this community
-                if len(community_tools) == 0:
-                    drop_idx_list.append(row_idx)
+    return dict(repositories = repositories, categories = categories, keep_tools = keep_tools, exclude_tools = exclude_tools)
+
+
+def classify_communities(communities, corpus, offline=False):
+    """
+    Assign the commits of the corpus to all matching communities at once, and get the dataframe of each community.
+
+    The rules of all communities are compiled into lookup tables first (category → community, tool → community, repository → community), which are then joined with the tool index of the corpus.
+    The dataframes are in the order of the communities, and the commits of each are in the order of its repositories (see `Corpus.get_repositories`), as if each community was filtered separately.
+    """
+    rules = [get_community_rules(community, offline) for community in communities]
+    filtered = [cidx for cidx, r in enumerate(rules) if r['categories'] is not None or len(r['keep_tools']) > 0]
+
+    # Compile the rules into lookup tables
+    category_table = pd.DataFrame([(category, cidx) for cidx in filtered if rules[cidx]['categories'] is not None for category in rules[cidx]['categories']], columns=['category', 'community'])
+    keep_table = pd.DataFrame([(tool, cidx) for cidx in filtered for tool in rules[cidx]['keep_tools']], columns=['tool', 'community'])
+    exclude_table = pd.DataFrame([(tool, cidx) for cidx in filtered for tool in rules[cidx]['exclude_tools']], columns=['tool', 'community'])
+    repository_table = pd.DataFrame([(repo, cidx) for cidx in filtered for repo in dict.fromkeys(rules[cidx]['repositories'])], columns=['repository', 'community'])
+    keep_all = pd.DataFrame(dict(community = [cidx for cidx in filtered if rules[cidx]['categories'] is None]))
+
+    # Only the tools which have any of the categories, or which are explicitly kept, can match (unless a community keeps all tools)
+    df_tools = corpus.tools.astype(dict(repository = str, tool = str, category = str))
+    if len(keep_all) == 0:
+        category_index = cache.get_cached_category_index()
+        candidate_tools = frozenset(category_index.tool[category_index.category.isin(category_table.category)]) | frozenset(keep_table.tool)
+        df_tools = df_tools[df_tools.tool.isin(candidate_tools)]
+
+    # Determine the matching tools of each commit for each community (by category, or by the tool lists)…
+    matches = pd.concat([
+        df_tools.merge(category_table, on='category'),
+        df_tools.merge(keep_table, on='tool'),
+        df_tools.merge(keep_all, how='cross'),
+    ])
+
+    # …but only for the repositories of the community, and without the excluded tools
+    matches = matches.merge(repository_table, on=['repository', 'community'])
+    matches = matches.merge(exclude_table, on=['tool', 'community'], how='left', indicator=True)
+    matches = matches[matches['_merge'] == 'left_only'].drop_duplicates(['community', 'commit', 'tool'])
+
+    # Names of tools from each community, affected by each commit (sorted, so that the result doesn't depend on the order of the joins)
+    matches = matches.sort_values(['community', 'commit', 'tool'], kind='stable')
+    community_tools = matches.tool.groupby([matches.community, matches.commit]).agg(','.join)
+
+    # Partition the result into the dataframes of the communities
+    dataframes = dict()
+    for cidx, (community, r) in enumerate(zip(communities, rules)):
+        positions = corpus.get_repositories_positions(r['repositories'])
+        df = corpus.commits.iloc[positions]
+        if cidx in filtered:
+
+            # Drop the commits which didn't concern any tools from this community, and record the names of the concerned tools for the others
+            commit_tools = community_tools.reindex(pd.MultiIndex.from_arrays([np.full(len(positions), cidx), positions])).values
+            df = df[pd.notna(commit_tools)].assign(tools = commit_tools[pd.notna(commit_tools)])
 
-                # Otherwise, keep it and also record the names of the concerned tools
-                else:
-                    df.loc[row_idx, 'tools'] = ",".join(list(sorted(community_tools)))
+        else:
+            df = df.assign(tools = '')
 
-            # Drop the commits listed for removal
-            df.drop(drop_idx_list, inplace=True)
+        dataframes[community['id']] = df
+    return dataframes
 
-        else:
-            df.tools = ''
 
-        df['repository'] = repo
-        df_list.append(df)
-    return pd.concat(df_list)
+def get_community_dataframe(community, corpus, offline=False):
+    return classify_communities([community], corpus, offline)[community['id']]
 
 
 def render_repositories_chart(filepath, df_tools, community_name):
@@ -189,112 +260,429 @@ def render_repositories_chart(filepath, df_tools, community_name):
     ax.annotate(f'{len(df_tools)}', xy=(0, -0.1), fontsize=30, ha='center', va='bottom')
     ax.annotate(f'tools', xy=(0, -0.1), fontsize=18, ha='center', va='top')
     fig.set_facecolor('0.937')
-    fig.savefig(filepath)
+    fig.savefig(filepath, metadata=dict(Date=None))
+    plt.close(fig)
+
+
+BUILD_MANIFEST_FILEPATH = 'report/.manifest.csv'
+
+# Inputs shared by all pages, which are loaded once per worker process (see `init_worker`)
+worker_inputs = dict()
+
+
+def get_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def get_file_hash(filepath):
+    if os.path.isfile(filepath):
+        with open(filepath, 'rb') as fp:
+            return hashlib.sha256(fp.read()).hexdigest()
+    else:
+        return ''
+
+
+def get_avatars_hash(names):
+    avatar_cache = get_avatar_cache()
+    return get_hash(*[f'{name}:{get_file_hash(avatar_cache.get_filename(name))}' for name in sorted(names)])
+
+
+def get_build_manifest():
+    """
+    Get the hashes of the inputs of all pages from the previous build.
+    """
+    if os.path.isfile(BUILD_MANIFEST_FILEPATH):
+        df = pd.read_csv(BUILD_MANIFEST_FILEPATH, dtype=str, keep_default_na=False)
+        return dict(zip(df['page'].tolist(), df['hash'].tolist()))
+    else:
+        return dict()
+
+
+def set_build_manifest(manifest):
+    pages = sorted(manifest.keys())
+    df = pd.DataFrame(dict(page = pages, hash = [manifest[page] for page in pages]))
+    df.to_csv(BUILD_MANIFEST_FILEPATH, index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+
+def init_worker(corpus):
+    worker_inputs['corpus'] = corpus
+
+    # Load templates
+    with open('report/_community.md') as fp:
+        worker_inputs['community_template'] = Template(fp.read())
+    with open('report/_contributor.md') as fp:
+        worker_inputs['contributor_template'] = Template(fp.read())
+
+    # Load the avatar URLs (resolved for the pages, see `get_usercard`)
+    df_avatars = cache.get_cached_avatars()
+    worker_inputs['avatar_urls'] = dict(zip(df_avatars['name'].tolist(), df_avatars['avatar_url'].tolist()))
+
+    # Pages must be rebuilt when the code or the templates change
+    source_dir = os.path.dirname(__file__)
+    filepaths = [f'{source_dir}/{module}.py' for module in ('report', 'corpus', 'graphs', 'communitygraph', 'contributiongraph')]
+    filepaths += ['report/_community.md', 'report/_contributor.md']
+    worker_inputs['code_hash'] = get_hash(*[get_file_hash(filepath) for filepath in filepaths])
+
+
+# Counters of the caches of each process, which are summed up over the worker processes (see `run_pages`)
+CACHE_COUNTERS = [
+    (get_avatar_cache, ('hits', 'misses', 'downloads')),
+    (get_layout_cache, ('hits', 'misses')),
+]
+
+
+def get_cache_counters():
+    return [getattr(get_cache(), name) for get_cache, names in CACHE_COUNTERS for name in names]
+
+
+def add_cache_counters(deltas):
+    deltas = iter(deltas)
+    for get_cache, names in CACHE_COUNTERS:
+        for name in names:
+            setattr(get_cache(), name, getattr(get_cache(), name) + next(deltas))
 
 
-def update_communities():
+def run_page(function, *args):
+    """
+    Call `function` in a worker process, and return the result together with the changes of the cache counters meanwhile.
+    """
+    counters = get_cache_counters()
+    result = function(*args)
+    return result, [after - before for before, after in zip(counters, get_cache_counters())]
+
+
+def run_pages(function, tasks, corpus, jobs=1, desc=None):
+    """
+    Call `function` for each tuple of arguments in `tasks`, using `jobs` worker processes, and return the results.
+    """
+    if jobs <= 1:
+        init_worker(corpus)
+        return [function(*args) for args in tqdm(tasks, desc=desc)]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(corpus,)) as executor:
+            results = list(tqdm(executor.map(functools.partial(run_page, function), *zip(*tasks), chunksize=8), total=len(tasks), desc=desc))
+
+        # Count the cache hits and misses of the workers too
+        for _, deltas in results:
+            add_cache_counters(deltas)
+        return [result for result, _ in results]
+
+
+def update_pages(function, tasks, kind, names, outputs, corpus, manifest, jobs=1, desc=None):
+    """
+    Update the pages of a kind (`community` or `contributor`), and delete the outputs of the pages of that kind which no longer exist.
+
+    The `function` gets the hash of the page from the previous build as the last argument, and returns the new hash and whether the page was rebuilt.
+    """
+    pages = [f'{kind}/{name}' for name in names]
+    results = run_pages(function, [args + (manifest.get(page),) for args, page in zip(tasks, pages)], corpus, jobs, desc)
+    for page, (page_hash, _) in zip(pages, results):
+        manifest[page] = page_hash
+
+    # Delete the outputs of the pages which no longer exist
+    current_pages = frozenset(pages)
+    stale_pages = [page for page in manifest.keys() if page.split('/', 1)[0] == kind and page not in current_pages]
+    for page in stale_pages:
+        for filepath in outputs(page.split('/', 1)[1]):
+            if os.path.isfile(filepath):
+                os.remove(filepath)
+        del manifest[page]
+
+    rebuilt = sum(1 for _, page_rebuilt in results if page_rebuilt)
+    print(f'{desc}: {rebuilt} rebuilt, {len(results) - rebuilt} reused, {len(stale_pages)} deleted')
+
+
+TOP_CONTRIBUTORS = 6  ## Number of contributors shown with a user card (the others are only listed by name)
+
+
+def get_avatar_url(name):
+    avatar_url = worker_inputs['avatar_urls'].get(name.lower(), '')
+    return avatar_url if len(avatar_url) > 0 else None
+
+
+def get_commit_counts(df, column):
+    """
+    Get the number of commits per value of a column (e.g., per author), in descending order (ties are ordered by the first commit in `df`).
+
+    Commits without a value (e.g., without an author) are not counted.
+    """
+    values = df[column].dropna().astype(str)
+    counts = values[values.str.len() > 0].groupby(values, sort=False).size()
+    return counts.sort_values(ascending=False, kind='stable')
+
+
+def get_usercard(name, commits):
+    """
+    Summarize the commits of a contributor for `report/_includes/usercard.html`.
+    """
+    return dict(
+        name = name,
+        avatar_url = get_avatar_url(name),
+        commits = len(commits),
+        repositories = [
+            dict(name = repo, avatar_url = get_avatar_url(repo), commits = int(count))
+            for repo, count in get_commit_counts(commits, 'repository').items()
+        ],
+    )
+
+
+def get_contributors_summary(df):
+    """
+    Summarize the contributors of the commits of a community (the top contributors with user cards, the others only by name).
+    """
+    counts = get_commit_counts(df, 'author')
+    authors = df['author'].astype(str)
+    return dict(
+        commits = len(df),
+        contributors = len(counts),
+        top_contributors = [get_usercard(author, df[authors == author]) for author in counts.index[:TOP_CONTRIBUTORS]],
+        other_contributors = counts.index[TOP_CONTRIBUTORS:].tolist(),
+    )
+
+
+def get_community_summary(df, df_tools, since):
+    """
+    Precompute everything which `report/_community.md` shows, so that Jekyll does not need to scan the commits of the community.
+    """
+    df_window = filter_by_timestamp(df, first_day=since)
+
+    # The new contributors are those whose first commit is within the time window
+    first_commits = df.sort_values('timestamp', kind='stable').drop_duplicates('author')
+    new_authors = frozenset(filter_by_timestamp(first_commits, first_day=since)['author'].dropna().astype(str))
+    authors = df['author'].astype(str)
+
+    summary = dict(
+        all_time = get_contributors_summary(df),
+        last_year = get_contributors_summary(df_window),
+        new_contributors = [get_usercard(author, df[authors == author]) for author in get_commit_counts(df, 'author').index if author in new_authors],
+        tools = None,
+    )
+    if df_tools is not None:
+        summary['tools'] = dict(
+            count = len(df_tools),
+            repositories = [
+                dict(name = repo, tools = df_tools.tool[df_tools.repository == repo].tolist())
+                for repo in get_commit_counts(df_tools, 'repository').index
+            ],
+        )
+    return summary
+
+
+def get_contributor_summary(contributor, contributions, since):
+    """
+    Precompute everything which `report/_contributor.md` shows, so that Jekyll does not need to scan the commits of the contributor.
+    """
+    df_window = filter_by_timestamp(contributions, first_day=since)
+    repositories = df_window['repository'].astype(str)
+    return dict(
+        avatar_url = get_avatar_url(contributor),
+        commits = len(contributions),
+        commits_last_year = len(df_window),
+        repositories_last_year = [
+            dict(name = repo, commits = df_window.sha[repositories == repo].astype(str).tolist())
+            for repo in get_commit_counts(df_window, 'repository').index
+        ],
+    )
+
+
+def get_community_outputs(cid):
+    return [
+        f'report/_commits/communities/{cid}.csv',
+        f'report/_commits/communities/{cid}-tools.csv',
+        f'report/_data/communities_data/{cid}.json',
+        f'report/assets/images/communitygraphs/{cid}.png',
+        f'report/assets/images/repositorycharts/{cid}.svg',
+        f'report/communities/{cid}.md',
+    ]
+
+
+def update_community(community, df, since, previous_hash=None):
+    cid = community['id']
+    data = to_text(df).to_csv(index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+    # Create dataframe for the tools of the community
+    df_tools_rows = list()
+    for _, row in df.iterrows():
+        for tool in row.tools.split(','):
+            tool = tool.strip()
+            if len(tool) > 0:
+                df_tools_rows.append(dict(repository=row.repository, tool=tool))
+    if len(df_tools_rows) > 0:
+        df_tools = pd.DataFrame(df_tools_rows)
+        df_tools.drop_duplicates(inplace=True)
+        df_tools.sort_values(['repository', 'tool'], inplace=True)
+    else:
+        df_tools = None
+
+    # Summarize the commits for the community template
+    summary = json.dumps(get_community_summary(df, df_tools, since))
+
+    # Render community graph for the last year (if there is more than one repository)
+    render_graph = len(df.repository.drop_duplicates()) > 1
+
+    # Determine the hash of the inputs (the community graph also depends on the avatars of the authors and repositories within the time window)
+    def get_page_hash():
+        if render_graph:
+            df_window = filter_by_timestamp(df, first_day=since)
+            graph_hash = get_hash(to_text(df_window).to_csv(index=False), get_avatars_hash(['.blank'] + df_window.author.dropna().astype(str).tolist() + df_window.repository.astype(str).tolist()))
+        else:
+            graph_hash = ''
+        return get_hash(worker_inputs['code_hash'], json.dumps(community, sort_keys=True), data, summary, graph_hash)
+
+    if get_page_hash() == previous_hash and os.path.isfile(f'report/communities/{cid}.md') and os.path.isfile(f'report/_data/communities_data/{cid}.json'):
+        return previous_hash, False
+
+    with open(f'report/_commits/communities/{cid}.csv', 'w') as fp:
+        fp.write(data)
+    with open(f'report/_data/communities_data/{cid}.json', 'w') as fp:
+        fp.write(summary)
+
+    if render_graph:
+        communitygraph.render_community_graph(f'report/assets/images/communitygraphs/{cid}.png', df, community['name'], since=since)
+
+    # Render the community template
+    with open(f'report/communities/{cid}.md', 'w') as fp:
+        fp.write(worker_inputs['community_template'].render(community = community))
+
+    if df_tools is not None:
+        df_tools.to_csv(f'report/_commits/communities/{cid}-tools.csv', index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+        # Render the tools-per-repositories chart
+        render_repositories_chart(f'report/assets/images/repositorycharts/{cid}.svg', df_tools, community['name'])
+
+    # The avatars are available only now, if they were downloaded while rendering
+    return get_page_hash(), True
+
+
+def remove_raw_data(directory):
+    """
+    Remove the raw commits from the Jekyll data directory (written there by previous versions, now only the summaries are).
+    """
+    for filepath in glob.glob(f'{directory}/*.csv'):
+        os.remove(filepath)
+
+
+def update_communities(corpus, since, manifest, jobs=1, offline=False):
 
     # Load communities
     with open('communities.yml') as fp:
         communities = yaml.safe_load(fp)['communities']
 
-    # Load template
-    with open('report/_community.md') as fp:
-        template = Template(fp.read())
+    # Prepare directories for community data, graphs, and repository charts
+    os.makedirs('report/_commits/communities', exist_ok=True)
+    os.makedirs('report/_data/communities_data', exist_ok=True)
+    os.makedirs('report/assets/images/communitygraphs', exist_ok=True)
+    os.makedirs('report/assets/images/repositorycharts', exist_ok=True)
+    remove_raw_data('report/_data/communities_data')
 
-    # Prepare directory for community graphs
-    communitygraphs_dir = 'report/assets/images/communitygraphs'
-    os.makedirs(communitygraphs_dir, exist_ok=True)
+    # Assign the commits to the communities
+    community_dataframes = classify_communities(communities, corpus, offline)
 
-    # Prepare directory for repository charts
-    repositorycharts_dir = 'report/assets/images/repositorycharts'
-    os.makedirs(repositorycharts_dir, exist_ok=True)
+    # Download the avatars required by the community graphs at once (see `update_community`)
+    authors, repositories = set(), set()
+    for df in community_dataframes.values():
+        if len(df.repository.drop_duplicates()) > 1:
+            df_window = filter_by_timestamp(df, first_day=since)
+            authors |= frozenset(author for author in df_window.author.dropna().astype(str) if len(author) > 0)
+            repositories |= frozenset(df_window.repository.astype(str))
+    get_avatar_cache().load(sorted(authors), sorted(repositories), desc='Downloading avatars')
 
     # Render community pages
     os.makedirs('report/communities', exist_ok=True)
-    for community in (pbar := tqdm(communities)):
-        cid = community['id']
-        pbar.set_description_str(cid)
-        df = get_community_dataframe(community)
-        communities_data_dir = 'report/_data/communities_data'
-        os.makedirs(communities_data_dir, exist_ok=True)
-        df.to_csv(f'{communities_data_dir}/{cid}.csv', index=False, quoting=csv.QUOTE_NONNUMERIC)
-
-        # Render community graph for the last year (if there is more than one repository)
-        if len(df.repository.drop_duplicates()) > 1:
-            since = datetime.now(timezone.utc) - timedelta(days=365)
-            communitygraph.render_community_graph(f'{communitygraphs_dir}/{cid}.png', cid, community['name'], since=since)
-
-        # Render the community template
-        with open(f'report/communities/{cid}.md', 'w') as fp:
-            fp.write(template.render(community = community))
-
-        # Create dataframe for the tools of the community
-        df_tools_rows = list()
-        for _, row in df.iterrows():
-            for tool in row.tools.split(','):
-                tool = tool.strip()
-                if len(tool) > 0:
-                    df_tools_rows.append(dict(repository=row.repository, tool=tool))
-        if len(df_tools_rows) > 0:
-            df_tools = pd.DataFrame(df_tools_rows)
-            df_tools.drop_duplicates(inplace=True)
-            df_tools.sort_values(['repository', 'tool'], inplace=True)
-            df_tools.to_csv(f'{communities_data_dir}/{cid}-tools.csv', index=False, quoting=csv.QUOTE_NONNUMERIC)
-
-            # Render the tools-per-repositories chart
-            render_repositories_chart(f'{repositorycharts_dir}/{cid}.svg', df_tools, community['name'])
-
-
-def get_contributors():
-
-    # Get cached contributors
-    repositories = cache.get_cached_repositories()
-
-    # Read cached repositories
-    df_list = list()
-    for repo in repositories:
-        df = pd.read_csv(cache.get_cached_repository_filepath(repo))
-        df['repository'] = repo
-        df.author.fillna('')
-        df_list.append(df)
-    df = pd.concat(df_list)
-
-    # Sort by contributors
-    contributors = df.author.drop_duplicates().values
-    return {contributor: df[df['author'] == contributor] for contributor in contributors}
-
-
-def update_contributors():
-    contributors_data_dir = 'report/_data/contributors_data'
-    os.makedirs(contributors_data_dir, exist_ok=True)
-
-    # Load template
-    with open('report/_contributor.md') as fp:
-        template = Template(fp.read())
+    tasks = [(community, community_dataframes[community['id']], since) for community in communities]
+    names = [community['id'] for community in communities]
+    update_pages(update_community, tasks, 'community', names, get_community_outputs, corpus, manifest, jobs, desc='Updating communities')
+
+
+def get_contributor_outputs(contributor):
+    return [
+        f'report/_commits/contributors/{contributor}.csv',
+        f'report/_data/contributors_data/{contributor}.json',
+        f'report/assets/images/contributiongraphs/{contributor}.png',
+        f'report/contributors/{contributor}.md',
+    ]
+
+
+def update_contributor(contributor, since, until, previous_hash=None):
+    contributions = worker_inputs['corpus'].get_contributor(contributor)
+    data = to_text(contributions).to_csv(index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+    # Summarize the commits for the contributor template
+    summary = json.dumps(get_contributor_summary(contributor, contributions, since))
+
+    # Determine the hash of the inputs (the contribution graph also depends on the time window and the avatars of the repositories, unless there were no contributions within the time window)
+    def get_page_hash():
+        df_window = filter_by_timestamp(contributions, first_day=since, last_day=until)
+        if len(df_window) > 0:
+            graph_hash = get_hash(since.strftime('%Y-%m-%d'), until.strftime('%Y-%m-%d'), to_text(df_window).to_csv(index=False), get_avatars_hash(df_window.repository.astype(str).tolist()))
+        else:
+            graph_hash = ''
+        return get_hash(worker_inputs['code_hash'], str(contributor), data, summary, graph_hash)
 
-    # Prepare directory for contribution graphs
-    contributiongraphs_dir = 'report/assets/images/contributiongraphs'
-    os.makedirs(contributiongraphs_dir, exist_ok=True)
+    if get_page_hash() == previous_hash and os.path.isfile(f'report/contributors/{contributor}.md') and os.path.isfile(f'report/_data/contributors_data/{contributor}.json'):
+        return previous_hash, False
+
+    with open(f'report/_commits/contributors/{contributor}.csv', 'w') as fp:
+        fp.write(data)
+    with open(f'report/_data/contributors_data/{contributor}.json', 'w') as fp:
+        fp.write(summary)
+
+    # Render contribution graph for the last year
+    contributiongraph.render_contribution_graph(f'report/assets/images/contributiongraphs/{contributor}.png', contributor, contributions, since=since, until=until)
+
+    # Render the community template
+    with open(f'report/contributors/{contributor}.md', 'w') as fp:
+        fp.write(worker_inputs['contributor_template'].render(contributor = contributor))
+
+    # The avatars are available only now, if they were downloaded while rendering
+    return get_page_hash(), True
+
+
+def update_contributors(corpus, since, until, manifest, jobs=1):
+
+    # Prepare directories for contributor data and contribution graphs
+    os.makedirs('report/_commits/contributors', exist_ok=True)
+    os.makedirs('report/_data/contributors_data', exist_ok=True)
+    os.makedirs('report/assets/images/contributiongraphs', exist_ok=True)
+    remove_raw_data('report/_data/contributors_data')
+
+    # Download the avatars required by the contribution graphs at once (see `update_contributor`)
+    df_window = filter_by_timestamp(corpus.commits[corpus.commits.author.notna()], first_day=since, last_day=until)
+    get_avatar_cache().load([], sorted(frozenset(df_window.repository.astype(str))), desc='Downloading avatars')
 
     # Render contributor pages
     os.makedirs('report/contributors', exist_ok=True)
-    for contributor, contributions in tqdm(get_contributors().items(), desc='Updating contributors'):
-        contributions.to_csv(f'{contributors_data_dir}/{contributor}.csv', index=False, quoting=csv.QUOTE_NONNUMERIC)
+    contributors = corpus.get_contributors()
+    tasks = [(contributor, since, until) for contributor in contributors]
+    update_pages(update_contributor, tasks, 'contributor', contributors, get_contributor_outputs, corpus, manifest, jobs, desc='Updating contributors')
+
+
+def update(jobs=1, offline=False):
 
-        # Render contribution graph for the last year
-        since = datetime.now(timezone.utc) - timedelta(days=365)
-        until = datetime.now(timezone.utc)
-        contributiongraph.render_contribution_graph(f'{contributiongraphs_dir}/{contributor}.png', contributor, since=since, until=until)
+    # Load the cached commit histories only once, for all communities and contributors
+    corpus = Corpus.from_cache()
 
-        # Render the community template
-        with open(f'report/contributors/{contributor}.md', 'w') as fp:
-            fp.write(template.render(contributor = contributor))
+    # All pages are rendered for the same time window (the last year)
+    until = datetime.now(timezone.utc)
+    since = until - timedelta(days=365)
 
+    # Pages are only rebuilt if their inputs have changed since the previous build
+    manifest = get_build_manifest()
+    update_communities(corpus, since, manifest, jobs, offline)
+    set_build_manifest(manifest)
+    update_contributors(corpus, since, until, manifest, jobs)
+    set_build_manifest(manifest)
 
-def update():
-    update_communities()
-    update_contributors()
+    # Remove the avatars whose URLs have changed, and the least recently used graphs
+    get_avatar_cache().prune()
+    get_layout_cache().prune()
+    print(get_avatar_cache().get_stats())
+    print(get_layout_cache().get_stats())
+    print(f'Corpus: {corpus.get_memory_usage() / 1024 ** 2:.0f} MB, peak memory usage: {get_peak_rss() / 1024 ** 2:.0f} MB')
 
 
 def build():
@@ -0,0 +1,77 @@
+import threading
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+
+import pytest
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Run a test in an empty working directory (the caches are located relative to it).
+    """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Local HTTP server which answers the requests using `respond`, and records the requests.
+
+    The `respond` function gets the method, the path, the headers, and the body of a request, and returns the status, the content type, and the body of the response (and optionally a dictionary of further headers).
+    Each recorded request is a dictionary of the method, the path, the headers, the body, and the client port (which tells whether connections were reused).
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.respond = None
+        self.requests = list()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'  ## Keep connections alive
+
+    def handle_request(self, method):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.requests.append(dict(method = method, path = self.path, headers = self.headers, body = body, port = self.client_address[1]))
+            status, content_type, content, *headers = self.server.respond(method, self.path, self.headers, body)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for name, value in (headers[0] if len(headers) > 0 else dict()).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """
+    Start a local stand-in HTTP server (see `StandInServer`).
+    """
+    server = StandInServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
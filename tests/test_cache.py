@@ -0,0 +1,50 @@
+import os
+
+import pandas as pd
+import pytest
+
+from activities import cache
+
+
+def create_history():
+    return pd.DataFrame(dict(
+        author = ['alice', 'bob', float('nan')],
+        timestamp = ['2024-01-01 10:00:00+00:00', '2024-01-02 10:00:00+00:00', '2024-01-03 10:00:00+00:00'],
+        sha = ['0123456', 'abcdef0', '1111111'],
+        tools = ['[{"name": "tool1", "categories": ["Imaging"]}]', '[]', float('nan')],
+    ))
+
+
+def test_parquet_storage_roundtrip(workdir, monkeypatch):
+    pytest.importorskip('pyarrow')
+    storage = cache.ParquetStorage()
+    history = create_history()
+    storage.write('owner/repo', history)
+    assert not storage.is_outdated('owner/repo')
+
+    # The commits must be read from the Parquet file, not from the CSV export
+    def read_csv(repository):
+        raise AssertionError('Read from CSV')
+    monkeypatch.setattr(storage.csv_storage, 'read_typed', read_csv)
+    pd.testing.assert_frame_equal(storage.read('owner/repo'), cache.CsvStorage().read('owner/repo'))
+
+
+def test_parquet_storage_outdated(workdir):
+    pytest.importorskip('pyarrow')
+    storage = cache.ParquetStorage()
+    storage.write('owner/repo', create_history())
+
+    # Update the CSV file (e.g., via git)
+    history = create_history().iloc[:2]
+    cache.CsvStorage().write('owner/repo', history)
+    csv_filepath = cache.CsvStorage().get_filepath('owner/repo')
+    os.utime(csv_filepath, (os.stat(csv_filepath).st_atime, os.stat(csv_filepath).st_mtime + 10))
+    assert storage.is_outdated('owner/repo')
+    assert len(storage.read('owner/repo')) == 2
+
+
+def test_migrate_to_parquet(workdir):
+    pytest.importorskip('pyarrow')
+    cache.CsvStorage().write('owner/repo', create_history())
+    cache.migrate_commit_histories('parquet')
+    assert not cache.ParquetStorage().is_outdated('owner/repo')
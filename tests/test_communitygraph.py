@@ -0,0 +1,70 @@
+import copy
+
+import numpy as np
+import pytest
+
+from activities.benchmark import create_synthetic_graph
+from activities.communitygraph import simplify_graph
+from activities.graphs import (
+    AvatarCache,
+    node_kwargs,
+    node_label_prefix,
+)
+
+
+def simplify_graph_reference(G, authors, repositories, avatar_cache, max_edges=50, max_nodes=np.inf, max_iterations=10_000):
+    """
+    Simplify a graph like previous versions of `communitygraph.simplify_graph` did: the node with the highest degree is searched among all nodes, and all edges and nodes are scanned in each iteration.
+
+    This never terminates for some graphs if `max_nodes` is small, hence the iterations are limited.
+    """
+    for _ in range(max_iterations):
+        if len(G.edges) <= max_edges and len(G.nodes) <= max_nodes: return
+        n, n_deg = max(G.degree, key=lambda n: n[1])
+        if n_deg == 2:
+            return
+        for u, v in G.edges:
+            if u == n or v == n:
+                G.remove_edge(u, v)
+        if '/' in n:
+            proxy = f'{node_label_prefix}{n_deg:d} contributors\n({100 * n_deg / len(authors):.0f}%)'
+            proxy_type = 'author'
+        else:
+            proxy = f'{node_label_prefix}{n_deg:d} repositories\n({100 * n_deg / len(repositories):.0f}%)'
+            proxy_type = 'repository'
+        G.add_node(proxy, type=proxy_type, image=avatar_cache.get_filename('.blank'), **node_kwargs)
+        G.add_edge(proxy, n, headclip='false', tailclip='false')
+        G.remove_nodes_from([n for n in G.nodes if G.degree[n] == 0])
+    raise AssertionError('Simplification did not terminate')
+
+
+@pytest.mark.parametrize('n_nodes, seed, max_nodes, stop', [
+    (60, 0, np.inf, 'edges'),
+    (60, 1, np.inf, 'edges'),
+    (60, 2, np.inf, 'edges'),
+    (200, 0, np.inf, 'edges'),
+    (200, 1, np.inf, 'edges'),
+    (60, 0, 40, 'nodes'),
+    (200, 1, 60, 'nodes'),
+    (200, 0, 10, 'degree'),
+])
+def test_simplify_graph(workdir, n_nodes, seed, max_nodes, stop):
+    G, authors, repositories = create_synthetic_graph(n_nodes, seed=seed)
+    avatar_cache = AvatarCache()
+    expected = copy.deepcopy(G)
+    simplify_graph_reference(expected, authors, repositories, avatar_cache, max_nodes=max_nodes)
+    simplify_graph(G, authors, repositories, avatar_cache, max_nodes=max_nodes)
+
+    # The nodes, edges, and their attributes are the same, in the same order
+    assert list(G.nodes(data=True)) == list(expected.nodes(data=True))
+    assert list(G.edges(data=True)) == list(expected.edges(data=True))
+
+    # The simplification stopped for the expected reason
+    if stop == 'degree':
+        assert max(deg for _, deg in G.degree) == 2 and len(G.nodes) > max_nodes
+    else:
+        assert len(G.edges) <= 50 and len(G.nodes) <= max_nodes
+    if stop == 'nodes':
+        unconstrained, _, _ = create_synthetic_graph(n_nodes, seed=seed)
+        simplify_graph(unconstrained, authors, repositories, avatar_cache)
+        assert len(unconstrained.nodes) > max_nodes
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from activities import cache
+from activities.corpus import Corpus, to_text
+
+
+def create_history(offset):
+    return pd.DataFrame(dict(
+        author = ['alice', 'bob', float('nan')],
+        timestamp = [f'2024-01-0{offset + day} 10:00:00+00:00' for day in range(3)],
+        sha = ['0123456', f'abcdef{offset}', '1111111'],
+        tools = ['[{"name": "tool1", "categories": ["Imaging"]}]', '[{"name": "tool2", "categories": []}, {"name": "tool3", "categories": ["A", "B"]}]', float('nan')],
+    ))
+
+
+def load_corpus(storage):
+    cache.set_storage(storage)
+    try:
+        return Corpus.from_cache()
+    finally:
+        cache.set_storage('csv')
+
+
+def test_corpus_from_typed_storage(workdir, monkeypatch):
+    pytest.importorskip('pyarrow')
+    for offset, repo in enumerate(['owner/repo1', 'owner/repo2']):
+        history = create_history(offset + 1)
+        cache.ParquetStorage().write(repo, history)
+        cache.set_cached_tool_index(repo, cache.to_tool_index(history))
+    corpus = load_corpus('csv')
+
+    # The corpus must be created from the typed columns, without a detour via the text representation
+    def to_text_commit_history(history):
+        raise AssertionError('Converted to text')
+    monkeypatch.setattr(cache, 'to_text_commit_history', to_text_commit_history)
+    typed_corpus = load_corpus('parquet')
+    assert typed_corpus.commits['tools'].iloc[0][0]['name'] == 'tool1'
+
+    # The views of the corpus are the same as for the text representation
+    pd.testing.assert_frame_equal(to_text(typed_corpus.commits), to_text(corpus.commits))
+    pd.testing.assert_frame_equal(typed_corpus.tools, corpus.tools)
+    assert len(corpus.tools) == 8
+    assert typed_corpus.get_contributors() == corpus.get_contributors() == ['alice', 'bob']
+    for contributor in corpus.get_contributors():
+        pd.testing.assert_frame_equal(to_text(typed_corpus.get_contributor(contributor)), to_text(corpus.get_contributor(contributor)))
+
+
+def test_query_typed(workdir):
+    cache.CsvStorage().write('owner/repo1', create_history(1))
+    cache.CsvStorage().write('owner/repo2', create_history(2))
+    commits = cache.CsvStorage().query_typed(['owner/repo2', 'owner/repo1'], authors=['bob'], since='2024-01-02', until='2024-01-03')
+    assert commits['sha'].astype(str).tolist() == ['abcdef1']
+    assert commits['repository'].tolist() == ['owner/repo1']
+    assert len(cache.CsvStorage().query_typed([])) == 0
@@ -0,0 +1,78 @@
+import json
+import urllib.parse
+from datetime import (
+    datetime,
+    timezone,
+)
+from types import SimpleNamespace
+
+import pandas as pd
+from github import Github
+
+from activities import cache, fetch
+
+
+class FakeCommits(list):
+
+    @property
+    def totalCount(self):
+        return len(self)
+
+
+class FakeRepository:
+
+    full_name = 'owner/repo'
+    owner = SimpleNamespace(login='owner')
+    name = 'repo'
+
+    def __init__(self, commits):
+        self.commits = commits
+
+    def get_commits(self, **kwargs):
+        return FakeCommits(self.commits)
+
+
+def create_commit(sha, date):
+    return SimpleNamespace(sha=sha, commit=SimpleNamespace(author=SimpleNamespace(date=date)))
+
+
+def test_resume_from_checkpoint_with_numeric_sha(workdir):
+    commits = [
+        create_commit('abcdef0' + '0' * 33, datetime(2024, 1, 3, tzinfo=timezone.utc)),
+        create_commit('0123456' + '0' * 33, datetime(2024, 1, 2, tzinfo=timezone.utc)),
+    ]
+    repository = FakeRepository(commits)
+
+    # The walk was interrupted after the first commit, whose short SHA consists only of digits
+    segment = pd.DataFrame(dict(author = ['alice'], timestamp = ['2024-01-02 00:00:00+00:00'], sha = ['0123456'], tools = ['[]']))
+    cache.append_checkpoint_segment(repository, segment)
+    resumed_df = cache.get_checkpoint_segments(repository)
+    assert resumed_df['sha'].tolist() == ['0123456']
+
+    # The checkpointed commit is not walked again
+    previous_df = pd.DataFrame(columns=['author', 'timestamp', 'sha', 'tools'])
+    walked = [short_sha for _, short_sha, _ in fetch.process_new_commits(repository, previous_df, resumed_commits=resumed_df)]
+    assert walked == ['abcdef0']
+
+
+def test_get_avatar_urls(server):
+    graphql_data = dict(
+        data = dict(a0 = dict(avatarUrl = 'https://avatars/alice'), a1 = None, a2 = None),
+        errors = [dict(type = 'NOT_FOUND', path = ['a1']), dict(type = 'NOT_FOUND', path = ['a2'])],
+    )
+
+    def respond(method, path, headers, body):
+        path = urllib.parse.unquote(path)
+        if path == '/graphql':
+            return 200, 'application/json', json.dumps(graphql_data).encode('utf-8')
+        elif path == '/users/dependabot[bot]':
+            return 200, 'application/json', json.dumps(dict(login = 'dependabot[bot]', avatar_url = 'https://avatars/dependabot')).encode('utf-8')
+        else:
+            return 404, 'application/json', json.dumps(dict(message = 'Not Found')).encode('utf-8')
+
+    server.respond = respond
+    g = Github(base_url=server.url, retry=None, seconds_between_requests=0, seconds_between_writes=0)
+
+    # Logins which are not found by GraphQL (e.g., bots) are looked up via REST
+    avatar_urls = fetch.get_avatar_urls(g, ['alice', 'dependabot[bot]', 'deleted-user'])
+    assert avatar_urls == {'alice': 'https://avatars/alice', 'dependabot[bot]': 'https://avatars/dependabot', 'deleted-user': ''}
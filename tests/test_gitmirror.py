@@ -0,0 +1,119 @@
+import os
+import subprocess
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from activities import cache, gitmirror
+from activities.fetch import (
+    RepositoryInfo,
+    ShedFileCache,
+)
+
+
+ALICE = ('Alice', '123+Alice@users.noreply.github.com')
+BOB = ('Bob', 'Bob@Example.org')
+CAROL = ('Carol', '456+Carol-X@users.noreply.github.com')
+NOBODY = ('Nobody', 'nobody@example.org')
+
+
+class GitRepository:
+    """
+    A local repository, in which commits are made with given authors and dates.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.path.mkdir(parents=True)
+        self.git('init', '--quiet', '-b', 'main')
+
+    def git(self, *args, author=ALICE, date=None):
+        env = dict(os.environ, GIT_AUTHOR_NAME=author[0], GIT_AUTHOR_EMAIL=author[1], GIT_COMMITTER_NAME=author[0], GIT_COMMITTER_EMAIL=author[1])
+        if date is not None:
+            env.update(GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+        return subprocess.run(['git', '-c', 'commit.gpgsign=false', '-C', str(self.path), *args], check=True, capture_output=True, text=True, env=env).stdout
+
+    def write(self, filepath, content):
+        (self.path / filepath).parent.mkdir(parents=True, exist_ok=True)
+        (self.path / filepath).write_text(content)
+        self.git('add', filepath)
+
+    def commit(self, message, author, date):
+        self.git('commit', '--quiet', '-m', message, author=author, date=date)
+        return self.git('rev-parse', 'HEAD').strip()
+
+
+@pytest.fixture
+def source_repository(tmp_path):
+    """
+    Create a repository with tool directories, a rename, a merge, and commits by authors with and without noreply addresses.
+    """
+    repo = GitRepository(tmp_path / 'source')
+    shas = dict()
+
+    repo.write('tools/tool1/.shed.yml', 'categories:\n- Imaging\n')
+    repo.write('tools/tool1/tool1.xml', '<tool/>')
+    shas['add tool1'] = repo.commit('add tool1', ALICE, '2024-01-01T10:00:00+02:00')
+
+    repo.write('tools/tool2/.shed.yml', 'categories:\n- Statistics\n- Imaging\n')
+    repo.write('tools/tool2/tool2.xml', '<tool/>')
+    repo.write('README.md', 'Tools')
+    shas['add tool2'] = repo.commit('add tool2', BOB, '2024-01-02T10:00:00+00:00')
+
+    repo.git('mv', 'tools/tool1/tool1.xml', 'tools/tool1/main.xml')
+    shas['rename'] = repo.commit('rename', ALICE, '2024-01-03T10:00:00+00:00')
+
+    repo.git('checkout', '--quiet', '-b', 'feature')
+    repo.write('tools/tool2/tool2.xml', '<tool version="2"/>')
+    shas['update tool2'] = repo.commit('update tool2', CAROL, '2024-01-04T10:00:00+00:00')
+
+    repo.git('checkout', '--quiet', 'main')
+    repo.write('README.md', 'Tools and docs')
+    shas['update readme'] = repo.commit('update readme', NOBODY, '2024-01-05T10:00:00+00:00')
+    repo.git('merge', '--quiet', '--no-ff', '-m', 'merge', 'feature', author=ALICE, date='2024-01-06T10:00:00+00:00')
+    shas['merge'] = repo.git('rev-parse', 'HEAD').strip()
+
+    return repo, shas
+
+
+class FakeRepository:
+
+    owner = SimpleNamespace(login='owner')
+    name = 'repo'
+    full_name = 'owner/repo'
+    pushed_at = '2024-01-06 10:00:00+00:00'
+
+    def __init__(self, clone_url, authors):
+        self.clone_url = clone_url
+        self.authors = authors
+        self.requested_commits = list()
+
+    def get_commit(self, sha):
+        self.requested_commits.append(sha)
+        login = self.authors.get(sha)
+        return SimpleNamespace(author=SimpleNamespace(login=login) if login is not None else None)
+
+
+def test_get_commit_history(workdir, source_repository):
+    repo, shas = source_repository
+    repository = FakeRepository(str(repo.path), {shas['add tool2']: 'Bob-Login'})
+
+    # Logins of noreply addresses were stored lower-cased by previous versions
+    os.makedirs('cache/mirrors')
+    pd.DataFrame(dict(email = ['123+alice@users.noreply.github.com'], login = ['alice'])).to_csv(gitmirror.get_logins_filepath(), index=False)
+
+    gitmirror.get_commit_history(repository, RepositoryInfo('https://github.com/owner/repo', True), shed_files=ShedFileCache())
+    df = pd.read_csv(cache.get_cached_repository_filepath(repository), dtype=str, keep_default_na=False)
+    expected = [
+        ['Alice', '2024-01-01 08:00:00+00:00', shas['add tool1'], '[{"name": "tool1", "categories": ["Imaging"]}]'],
+        ['Bob-Login', '2024-01-02 10:00:00+00:00', shas['add tool2'], '[{"name": "tool2", "categories": ["Imaging", "Statistics"]}]'],
+        ['Alice', '2024-01-03 10:00:00+00:00', shas['rename'], '[{"name": "tool1", "categories": ["Imaging"]}]'],
+        ['Carol-X', '2024-01-04 10:00:00+00:00', shas['update tool2'], '[{"name": "tool2", "categories": ["Imaging", "Statistics"]}]'],
+        ['', '2024-01-05 10:00:00+00:00', shas['update readme'], ''],
+        ['Alice', '2024-01-06 10:00:00+00:00', shas['merge'], '[{"name": "tool2", "categories": ["Imaging", "Statistics"]}]'],
+    ]
+    assert df.values.tolist() == [[author, timestamp, sha[:7], tools] for author, timestamp, sha, tools in expected]
+
+    # Only the emails without noreply address were resolved via the API (once per email)
+    assert sorted(repository.requested_commits) == sorted([shas['add tool2'], shas['update readme']])
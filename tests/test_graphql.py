@@ -0,0 +1,152 @@
+import json
+import pathlib
+from types import SimpleNamespace
+
+import pytest
+
+from github import Github
+from github.GithubException import GithubException
+
+from activities import cache, graphql
+from activities.fetch import (
+    RepositoryInfo,
+    ShedFileCache,
+    get_manifest_entry,
+)
+
+
+DATA_DIR = pathlib.Path(__file__).parent / 'data' / 'graphql'
+
+
+def replay(server, exchanges):
+    """
+    Let the stand-in server replay recorded responses, in order.
+    """
+    responses = iter(exchange['response'] for exchange in exchanges)
+
+    def respond(method, path, headers, body):
+        response = next(responses)
+        return response['status'], 'application/json', json.dumps(response['body']).encode('utf-8')
+
+    server.respond = respond
+
+
+def get_queries(server):
+    return [json.loads(request['body']) for request in server.requests]
+
+
+def create_github(server):
+    return Github(base_url=server.url, retry=None, seconds_between_requests=0, seconds_between_writes=0)
+
+
+def create_client(server, **kwargs):
+    return graphql.GraphQLClient(create_github(server), **kwargs)
+
+
+def create_page(nodes, cursor=None):
+    return dict(data=dict(
+        repository=dict(defaultBranchRef=dict(target=dict(history=dict(totalCount=3, pageInfo=dict(hasNextPage=cursor is not None, endCursor=cursor), nodes=nodes)))),
+        rateLimit=dict(cost=1, remaining=4999, resetAt='2024-01-10T00:00:00Z'),
+    ))
+
+
+def test_history_pages(server):
+    replay(server, [
+        dict(response=dict(status=200, body=create_page([dict(oid='a' * 40)], 'cursor1'))),
+        dict(response=dict(status=200, body=create_page([dict(oid='b' * 40)], 'cursor2'))),
+        dict(response=dict(status=200, body=create_page([dict(oid='c' * 40)]))),
+    ])
+    client = create_client(server)
+    pages = list(graphql.get_history_pages(client, 'owner', 'repo'))
+    assert [node['oid'][0] for page in pages for node in page['nodes']] == ['a', 'b', 'c']
+    assert [query['variables']['after'] for query in get_queries(server)] == [None, 'cursor1', 'cursor2']
+    assert client.requests == 3 and client.cost == 3
+
+
+def test_page_size_halved_on_errors(server):
+    replay(server, [
+        dict(response=dict(status=502, body=dict(message='Server Error'))),
+        dict(response=dict(status=504, body=dict(message='Timeout'))),
+        dict(response=dict(status=200, body=create_page([dict(oid='a' * 40)], 'cursor1'))),
+        dict(response=dict(status=200, body=create_page([dict(oid='b' * 40)]))),
+    ])
+    client = create_client(server)
+    list(graphql.get_history_pages(client, 'owner', 'repo'))
+
+    # The page size is halved after each error, and grows back after each successful query
+    assert [query['variables']['first'] for query in get_queries(server)] == [100, 50, 25, 50]
+    assert client.page_size == 100
+
+
+def test_page_size_exhausted(server):
+    replay(server, [dict(response=dict(status=502, body=dict(message='Server Error')))] * 3)
+    client = create_client(server, max_page_size=40, min_page_size=10)
+    with pytest.raises(GithubException):
+        list(graphql.get_history_pages(client, 'owner', 'repo'))
+    assert [query['variables']['first'] for query in get_queries(server)] == [40, 20, 10]
+
+
+def test_blob_lookup_batches(server):
+    rate_limit = dict(cost=1, remaining=4999, resetAt='2024-01-10T00:00:00Z')
+    replay(server, [
+        dict(response=dict(status=200, body=dict(data=dict(repository=dict(f0=dict(oid='1' * 40, text='categories: []\n'), f1=None), rateLimit=rate_limit)))),
+        dict(response=dict(status=200, body=dict(data=dict(repository=dict(f0=dict()), rateLimit=rate_limit)))),
+    ])
+    blobs = graphql.BlobLookup(create_client(server), 'owner', 'repo', max_aliases=2)
+    blobs.prefetch(['sha1:a/.shed.yml', 'sha1:.shed.yml', 'sha1:a/.shed.yml', 'sha2:b'])
+
+    # Duplicate expressions are looked up only once, and at most `max_aliases` per query
+    queries = [query['query'] for query in get_queries(server)]
+    assert len(queries) == 2
+    assert 'f0: object(expression: "sha1:a/.shed.yml")' in queries[0] and 'f1: object(expression: "sha1:.shed.yml")' in queries[0]
+    assert 'f0: object(expression: "sha2:b")' in queries[1] and 'f1:' not in queries[1]
+
+    # Missing files and trees are not found
+    assert blobs.read('sha1', 'a/.shed.yml') == ('1' * 40, b'categories: []\n')
+    assert blobs.read('sha1', '.shed.yml') is None
+    assert blobs.read('sha2', 'b') is None
+
+    # Files which were already looked up are not queried again
+    blobs.prefetch(['sha1:a/.shed.yml'])
+    assert len(server.requests) == 2
+
+
+class FakeRepository:
+    """
+    Stands in for the REST API, which reports the files changed by the commits.
+    """
+
+    owner = SimpleNamespace(login='owner')
+    name = 'repo'
+    full_name = 'owner/repo'
+    pushed_at = '2024-01-04 10:00:00+00:00'
+
+    def __init__(self, files):
+        self.files = files
+
+    def get_commit(self, sha):
+        return SimpleNamespace(files=[SimpleNamespace(filename=filename) for filename in self.files[sha]])
+
+
+def test_commit_history(workdir, server):
+    with open(DATA_DIR / 'history.json') as fp:
+        exchanges = json.load(fp)
+    with open(DATA_DIR / 'files.json') as fp:
+        repository = FakeRepository(json.load(fp))
+    replay(server, exchanges)
+    graphql.get_commit_history(create_github(server), repository, RepositoryInfo('https://github.com/owner/repo', True), shed_files=ShedFileCache())
+
+    # The queries were sent as recorded
+    queries = get_queries(server)
+    assert len(queries) == len(exchanges)
+    for query, exchange in zip(queries, exchanges):
+        assert query['variables'] == exchange['request']['variables']
+        for alias in exchange['request'].get('aliases', list()):
+            assert alias in query['query']
+
+    # The CSV file has the rows which the REST backend writes for these commits
+    with open(cache.get_cached_repository_filepath(repository)) as fp:
+        csv = fp.read()
+    with open(DATA_DIR / 'expected.csv') as fp:
+        assert csv == fp.read()
+    assert get_manifest_entry(repository)['head_sha'] == 'd' * 40
@@ -0,0 +1,64 @@
+import io
+import os
+
+import pandas as pd
+from PIL import Image
+
+from activities import cache
+from activities.graphs import AvatarCache
+
+
+def create_avatar_server(server, failing_paths=()):
+    """
+    Let the stand-in server serve generated avatars (PNG or JPEG, by the extension of the path), where the first request of each of the `failing_paths` fails.
+    """
+    failed_paths = set()
+
+    def respond(method, path, headers, body):
+        if path in failing_paths and path not in failed_paths:
+            failed_paths.add(path)
+            return 503, 'text/plain', b''
+        buffer = io.BytesIO()
+        Image.new('RGB', (460, 460), (200, 100, 50)).save(buffer, 'PNG' if path.endswith('.png') else 'JPEG')
+        return 200, 'image/png' if path.endswith('.png') else 'image/jpeg', buffer.getvalue()
+
+    server.respond = respond
+
+
+def test_avatar_cache(workdir, server):
+    create_avatar_server(server, failing_paths=['/bob.jpg', '/owner.png'])
+    cache.set_cached_avatars(pd.DataFrame(dict(
+        name = ['alice', 'bob', 'carol', 'owner/repo1', 'owner/repo2'],
+        avatar_url = [f'{server.url}/alice.png', f'{server.url}/bob.jpg', '', f'{server.url}/owner.png', f'{server.url}/owner.png'],
+        timestamp = '2030-01-01 00:00:00+00:00',
+    )))
+    authors, repositories = ['Alice', 'bob', 'carol'], ['owner/repo1', 'owner/repo2']
+
+    # Each URL is downloaded only once, and failed requests are retried
+    avatar_cache = AvatarCache(max_workers=2)
+    avatar_cache.load(authors, repositories)
+    paths = [request['path'] for request in server.requests]
+    assert sorted(paths) == ['/alice.png', '/bob.jpg', '/bob.jpg', '/owner.png', '/owner.png']
+    assert avatar_cache.downloads == 3
+    assert avatar_cache.misses == 4  ## The images of alice, bob, the owner, and the blank avatar (also used by carol)
+    for name in authors + repositories:
+        assert os.path.isfile(avatar_cache.get_filename(name))
+    assert avatar_cache.get_filename('owner/repo1') == avatar_cache.get_filename('owner/repo2')
+    assert avatar_cache.get_filename('carol') == avatar_cache.get_filename('.blank')
+
+    # The connections are reused
+    assert len(frozenset(request['port'] for request in server.requests)) <= 2
+
+    # The avatars are not loaded again, neither by the same cache, nor by another one
+    avatar_cache.load(authors, repositories)
+    avatar_cache = AvatarCache(max_workers=2)
+    avatar_cache.load(authors, repositories)
+    assert len(server.requests) == 5
+    assert (avatar_cache.hits, avatar_cache.misses) == (4, 0)
+
+    # Only missing avatars are downloaded
+    os.remove(avatar_cache.get_filename('bob'))
+    avatar_cache = AvatarCache(max_workers=2)
+    avatar_cache.load(authors, repositories)
+    assert [request['path'] for request in server.requests[5:]] == ['/bob.jpg']
+    assert (avatar_cache.hits, avatar_cache.misses, avatar_cache.downloads) == (3, 1, 1)
@@ -0,0 +1,289 @@
+import json
+import os
+import pathlib
+import shutil
+from datetime import (
+    datetime,
+    timezone,
+)
+
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+pytest.importorskip('pygraphviz')  ## Required by the graph renderers, which are imported by `report`
+
+from activities import cache, communitygraph, contributiongraph, graphs, report
+from activities.corpus import Corpus, to_text
+
+
+def create_list_server(server, responses):
+    """
+    Let the stand-in server answer the requests of a list with the given statuses, in order (the list has the ETag `"v2"`).
+    """
+    statuses = iter(responses)
+
+    def respond(method, path, headers, body):
+        status = next(statuses)
+        return status, 'text/plain', b'item1\nitem2\n' if status == 200 else b'', dict(ETag = '"v2"')
+
+    server.respond = respond
+
+
+def set_outdated_list(url):
+    cache.set_cached_list(url, dict(lines = ['item1'], etag = '"v1"', timestamp = '2000-01-01 00:00:00+00:00'))
+
+
+def test_fetch_list(workdir, server):
+    url = f'{server.url}/list.txt'
+    create_list_server(server, [200])
+    assert report.fetch_list(url) == ['item1', 'item2']
+    assert cache.get_cached_list(url)['etag'] == '"v2"'
+
+    # The cached list is used until it expires, and also in offline mode
+    assert report.fetch_list(url) == ['item1', 'item2']
+    set_outdated_list(url)
+    assert report.fetch_list(url, offline=True) == ['item1']
+    assert len(server.requests) == 1
+
+
+def test_fetch_list_revalidated(workdir, server):
+    url = f'{server.url}/list.txt'
+    set_outdated_list(url)
+    create_list_server(server, [304])
+    assert report.fetch_list(url) == ['item1']
+    assert server.requests[0]['headers']['If-None-Match'] == '"v1"'
+    assert cache.get_cached_list(url)['timestamp'] > '2000-01-01 00:00:00+00:00'
+
+
+def test_fetch_list_server_error(workdir, server, capsys):
+    url = f'{server.url}/list.txt'
+    create_list_server(server, [503, 404])
+
+    # The cached list is used if the server fails
+    set_outdated_list(url)
+    assert report.fetch_list(url) == ['item1']
+    assert 'Failed to revalidate' in capsys.readouterr().out
+
+    # Other errors are raised
+    with pytest.raises(report.urllib.error.HTTPError):
+        report.fetch_list(url)
+
+
+def test_fetch_list_not_cached(workdir, server):
+    url = f'{server.url}/list.txt'
+    create_list_server(server, [503])
+    with pytest.raises(report.urllib.error.HTTPError):
+        report.fetch_list(url)
+    with pytest.raises(ValueError):
+        report.fetch_list(url, offline=True)
+
+
+TOOLS = dict(
+    tool1 = ['Imaging'],
+    tool2 = ['Imaging', 'Proteomics'],
+    tool3 = ['proteomics '],
+    tool4 = [],
+    tool5 = ['Sequence Analysis'],
+)
+
+
+def create_cache(repositories, n_commits=40, seed=0):
+    """
+    Write the commit histories and tool indices of the given repositories to the cache, where the commits update random tools.
+    """
+    rng = np.random.default_rng(seed)
+    for repo in repositories:
+        tools = [rng.choice(list(TOOLS), rng.integers(0, 3), replace=False) for _ in range(n_commits)]
+        history = pd.DataFrame(dict(
+            author = rng.choice(['alice', 'bob', 'carol'], n_commits),
+            timestamp = [str(pd.Timestamp('2024-01-01', tz='UTC') + pd.Timedelta(hours=idx)) for idx in range(n_commits)],
+            sha = [f'{rng.integers(0, 16 ** 7):07x}' for _ in range(n_commits)],
+            tools = [json.dumps([dict(name = tool, categories = TOOLS[tool]) for tool in commit_tools]) for commit_tools in tools],
+        ))
+        cache.set_cached_commit_history(repo, history)
+        cache.set_cached_tool_index(repo, cache.to_tool_index(history))
+
+
+def filter_community(community, corpus):
+    """
+    Get the dataframe of a community by filtering the corpus for this community only (the rules as applied before all communities were classified at once).
+    """
+    rules = report.get_community_rules(community, offline=True)
+    df = corpus.get_repositories(rules['repositories'])
+    if rules['categories'] is None and len(rules['keep_tools']) == 0:
+        return df.assign(tools = '')
+
+    df_tools = corpus.get_tools(rules['repositories'])
+    keep = df_tools.category.isin(rules['categories']) if rules['categories'] is not None else pd.Series(True, index=df_tools.index)
+    keep |= df_tools.tool.isin(rules['keep_tools'])
+    keep &= ~df_tools.tool.isin(rules['exclude_tools'])
+    df_tools = df_tools[keep].drop_duplicates(['commit', 'tool'])
+    community_tools = df_tools.tool.astype(str).sort_values().groupby(df_tools.commit).agg(','.join)
+    commit_tools = community_tools.reindex(corpus.get_repositories_positions(rules['repositories'])).values
+    return df[pd.notna(commit_tools)].assign(tools = commit_tools[pd.notna(commit_tools)])
+
+
+LIST_URL = 'https://example.org/categories.tsv'
+
+COMMUNITIES = [
+    dict(id = 'repositories', name = 'Repositories', repositories = ['owner/repo3', 'owner/repo1']),
+    dict(id = 'imaging', name = 'Imaging', categories = ['Imaging']),
+    dict(id = 'overlapping', name = 'Overlapping', repositories = ['owner/repo3', 'owner/unknown', 'owner/repo1'], categories = ['Imaging', 'Proteomics'], **{'exclude-tools': ['tool2']}),
+    dict(id = 'pattern', name = 'Pattern', categories = [dict(expand = LIST_URL, filter = {'match-column': 1, 'match-value': 'x', 'retain-column': 2})], **{'keep-tools': ['tool4']}),
+    dict(id = 'keep', name = 'Keep', repositories = ['owner/repo2'], **{'keep-tools': ['tool4']}),
+]
+
+
+def set_cached_categories_list():
+    cache.set_cached_list(LIST_URL, dict(lines = ['x\tSequence Analysis', 'y\tImaging', 'x\tproteomics'], etag = None, timestamp = '2000-01-01 00:00:00+00:00'))
+
+
+def test_classify_communities(workdir, monkeypatch):
+    monkeypatch.setattr(report, 'expanded_lists', dict())
+    create_cache(['owner/repo1', 'owner/repo2', 'owner/repo3'])
+    set_cached_categories_list()
+    corpus = Corpus.from_cache()
+
+    # The same commits are assigned to each community as by filtering for each community separately, in the same order (with and without a community which keeps all tools)
+    for subset in (COMMUNITIES, COMMUNITIES[:-1]):
+        dataframes = report.classify_communities(subset, corpus, offline=True)
+        assert list(dataframes) == [community['id'] for community in subset]
+        for community in subset:
+            expected = filter_community(community, corpus)
+            pd.testing.assert_frame_equal(dataframes[community['id']], expected)
+            assert len(expected) > 0
+
+
+SINCE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+UNTIL = datetime(2024, 2, 1, tzinfo=timezone.utc)
+
+
+def render_graph(filepath, *args, since=None, until=None):
+    """
+    Stands in for the graph renderers (which require graphviz), and writes the commits which the graph would show instead.
+    """
+    df = next(arg for arg in args if isinstance(arg, pd.DataFrame))
+    with open(filepath, 'w') as fp:
+        fp.write(to_text(graphs.filter_by_timestamp(df, first_day=since, last_day=until)).to_csv(index=False))
+
+
+def create_report(directory, monkeypatch, communities=COMMUNITIES):
+    """
+    Prepare the working directory for building the report pages from a synthetic cache.
+    """
+    directory.mkdir(exist_ok=True)
+    monkeypatch.chdir(directory)
+    monkeypatch.setattr(report, 'expanded_lists', dict())
+    monkeypatch.setattr(graphs, 'avatar_cache', None)
+    monkeypatch.setattr(graphs, 'layout_cache', None)
+    monkeypatch.setattr(communitygraph, 'render_community_graph', render_graph)
+    monkeypatch.setattr(contributiongraph, 'render_contribution_graph', render_graph)
+    os.makedirs('report')
+    for template in ('_community.md', '_contributor.md'):
+        shutil.copy(pathlib.Path(__file__).parents[1] / 'report' / template, 'report')
+    create_cache(['owner/repo1', 'owner/repo2', 'owner/repo3'])
+    set_cached_categories_list()
+    write_communities(communities)
+
+    # The avatars are blank (no URLs), so that nothing is downloaded
+    names = ['alice', 'bob', 'carol', 'dave', 'owner/repo1', 'owner/repo2', 'owner/repo3']
+    cache.set_cached_avatars(pd.DataFrame(dict(name = names, avatar_url = '', timestamp = '2030-01-01 00:00:00+00:00')))
+
+
+def write_communities(communities):
+    with open('communities.yml', 'w') as fp:
+        yaml.safe_dump(dict(communities = communities), fp)
+
+
+def build_pages(jobs=1):
+    """
+    Update the pages like `report.update` does, but for a fixed time window.
+    """
+    corpus = Corpus.from_cache()
+    manifest = report.get_build_manifest()
+    report.update_communities(corpus, SINCE, manifest, jobs, offline=True)
+    report.update_contributors(corpus, SINCE, UNTIL, manifest, jobs)
+    report.set_build_manifest(manifest)
+    return manifest
+
+
+def read_files(directory):
+    return {str(filepath.relative_to(directory)): filepath.read_bytes() for filepath in sorted(pathlib.Path(directory).rglob('*')) if filepath.is_file()}
+
+
+def test_update_pages_parallel(tmp_path, monkeypatch):
+    files = dict()
+    for jobs in (1, 2):
+        create_report(tmp_path / f'jobs{jobs}', monkeypatch)
+        build_pages(jobs)
+        files[jobs] = read_files('report')
+
+    # The pages, summaries, commits, and graphs are the same, regardless of the number of worker processes
+    assert files[1] == files[2]
+    assert 'communities/imaging.md' in files[1] and '_data/communities_data/imaging.json' in files[1]
+    assert 'assets/images/communitygraphs/imaging.png' in files[1] and 'assets/images/contributiongraphs/alice.png' in files[1]
+    assert frozenset(page for page in files[1] if page.startswith('contributors/')) == frozenset(['contributors/alice.md', 'contributors/bob.md', 'contributors/carol.md'])
+
+
+def test_update_pages_unchanged(workdir, monkeypatch, capsys):
+    create_report(workdir, monkeypatch)
+    manifest = build_pages()
+    files = read_files('report')
+    assert 'Updating communities: 5 rebuilt, 0 reused, 0 deleted' in capsys.readouterr().out
+
+    # Pages with unchanged inputs are skipped
+    assert build_pages() == manifest
+    assert read_files('report') == files
+    output = capsys.readouterr().out
+    assert 'Updating communities: 0 rebuilt, 5 reused, 0 deleted' in output
+    assert 'Updating contributors: 0 rebuilt, 3 reused, 0 deleted' in output
+
+
+def test_update_pages_changed(workdir, monkeypatch, capsys):
+    create_report(workdir, monkeypatch)
+    manifest = build_pages()
+    capsys.readouterr()
+
+    # Change the rules of a community, and the commits of a repository (by a single contributor)
+    communities = [dict(community) for community in COMMUNITIES]
+    communities[1]['name'] = 'Image Analysis'
+    write_communities(communities)
+    history = cache.get_cached_commit_history('owner/repo2')
+    history = pd.concat([history, pd.DataFrame(dict(author = ['dave'], timestamp = ['2024-01-10 00:00:00+00:00'], sha = ['fffffff'], tools = ['[{"name": "tool4", "categories": []}]']))], ignore_index=True)
+    cache.set_cached_commit_history('owner/repo2', history)
+    cache.set_cached_tool_index('owner/repo2', cache.to_tool_index(history))
+
+    # Only the pages with changed inputs are rebuilt
+    new_manifest = build_pages()
+    output = capsys.readouterr().out
+    assert 'Updating communities: 3 rebuilt, 2 reused, 0 deleted' in output  ## The renamed community, and the communities of the repository which keep the tool
+    assert 'Updating contributors: 1 rebuilt, 3 reused, 0 deleted' in output
+    assert sorted(page for page in new_manifest if new_manifest[page] != manifest.get(page)) == ['community/imaging', 'community/keep', 'community/pattern', 'contributor/dave']
+    assert 'dave' in pathlib.Path('report/_commits/communities/keep.csv').read_text()
+
+
+def test_update_pages_removed(workdir, monkeypatch, capsys):
+    create_report(workdir, monkeypatch)
+    build_pages()
+    capsys.readouterr()
+    assert os.path.isfile('report/communities/keep.md') and os.path.isfile('report/contributors/carol.md')
+
+    # Remove a community, and all commits of a contributor
+    write_communities(COMMUNITIES[:-1])
+    for repo in cache.get_cached_repositories():
+        history = cache.get_cached_commit_history(repo)
+        history = history[history['author'] != 'carol']
+        cache.set_cached_commit_history(repo, history)
+        cache.set_cached_tool_index(repo, cache.to_tool_index(history))
+
+    # The pages and their outputs are deleted
+    manifest = build_pages()
+    output = capsys.readouterr().out
+    assert 'Updating communities: 4 rebuilt, 0 reused, 1 deleted' in output  ## The other communities lost the commits of the contributor
+    assert 'Updating contributors: 0 rebuilt, 2 reused, 1 deleted' in output
+    assert 'community/keep' not in manifest and 'contributor/carol' not in manifest
+    assert report.get_build_manifest() == manifest
+    for filepath in report.get_community_outputs('keep') + report.get_contributor_outputs('carol'):
+        assert not os.path.isfile(filepath), filepath